@@ -0,0 +1,60 @@
+import time
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError
+
+from .routers import mark_replica_unhealthy, pin_to_primary, request_scope, used_replicas
+
+PIN_COOKIE = 'tw_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaPinningMiddleware:
+    """Pin reads to the primary for writes and for a short while after them.
+
+    Unsafe requests are served entirely from the primary. Their responses set a
+    cookie so the same client keeps reading from the primary for
+    REPLICA_PIN_SECONDS, long enough for replicas to catch up with the write.
+    A safe request whose view fails with a database error after reading from a
+    replica marks that replica unhealthy and is retried once on the primary.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with request_scope():
+            writing = request.method not in SAFE_METHODS
+            if writing or self._pinned_by_cookie(request):
+                pin_to_primary()
+
+            response = self.get_response(request)
+
+            if writing and settings.DATABASE_REPLICAS:
+                response.set_cookie(
+                    PIN_COOKIE,
+                    str(int(time.time() + settings.REPLICA_PIN_SECONDS)),
+                    max_age=settings.REPLICA_PIN_SECONDS,
+                    # The frontend calls the API cross-site, so a Lax cookie would never come back
+                    samesite='None',
+                    secure=True,
+                    httponly=True,
+                )
+            return response
+
+    def process_exception(self, request, exception):
+        replicas = used_replicas()
+        if (not replicas or request.method not in SAFE_METHODS
+                or not isinstance(exception, (OperationalError, InterfaceError))):
+            return None
+        for alias in replicas:
+            mark_replica_unhealthy(alias)
+        pin_to_primary()
+        match = request.resolver_match
+        return match.func(request, *match.args, **match.kwargs)
+
+    def _pinned_by_cookie(self, request):
+        try:
+            return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
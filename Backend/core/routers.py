@@ -0,0 +1,133 @@
+"""
+Primary/replica database routing.
+
+Writes always go to ``default``. Reads go to a healthy replica from
+``settings.DATABASE_REPLICAS`` unless the current request is pinned to the
+primary (see ``core.middleware.ReplicaPinningMiddleware``), in which case the
+client reads its own writes. Replicas that fail to connect or lag too far
+behind are skipped until they are checked again, and reads fall back to the
+primary when no replica is usable. A replica that fails in the middle of a
+request is marked unhealthy as well, and the middleware retries the request
+on the primary.
+"""
+import contextvars
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+PRIMARY = 'default'
+
+_pinned = contextvars.ContextVar('tripwise_pinned_to_primary', default=False)
+# Replicas the current request has read from
+_used_replicas = contextvars.ContextVar('tripwise_used_replicas', default=())
+
+# alias -> (monotonic time checked, healthy)
+_replica_health = {}
+
+_POSTGRES_LAG_SQL = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def pin_to_primary():
+    """Send every read for the rest of the current request to the primary."""
+    _pinned.set(True)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+def used_replicas():
+    return _used_replicas.get()
+
+
+@contextmanager
+def use_primary():
+    """Temporarily route reads to the primary."""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+@contextmanager
+def request_scope():
+    """Reset pinning at the end of a request so it never leaks to the next one."""
+    token = _pinned.set(False)
+    used_token = _used_replicas.set(())
+    try:
+        yield
+    finally:
+        _used_replicas.reset(used_token)
+        _pinned.reset(token)
+
+
+def _check_replica(alias):
+    try:
+        connection = connections[alias]
+        connection.ensure_connection()
+        if connection.vendor != 'postgresql':
+            return True
+        with connection.cursor() as cursor:
+            cursor.execute(_POSTGRES_LAG_SQL)
+            lag = cursor.fetchone()[0]
+        return lag is None or float(lag) <= settings.REPLICA_MAX_LAG_SECONDS
+    except DatabaseError:
+        return False
+
+
+def replica_is_healthy(alias):
+    now = time.monotonic()
+    checked = _replica_health.get(alias)
+    if checked is not None:
+        checked_at, healthy = checked
+        interval = settings.REPLICA_HEALTH_CHECK_SECONDS if healthy else settings.REPLICA_RETRY_SECONDS
+        if now - checked_at < interval:
+            return healthy
+    healthy = _check_replica(alias)
+    _replica_health[alias] = (now, healthy)
+    return healthy
+
+
+def mark_replica_unhealthy(alias):
+    """Skip a replica until it is re-checked after REPLICA_RETRY_SECONDS."""
+    _replica_health[alias] = (time.monotonic(), False)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _pinned.get():
+            return PRIMARY
+        # Keep related lookups on the database the instance came from
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        replicas = [alias for alias in settings.DATABASE_REPLICAS if replica_is_healthy(alias)]
+        if not replicas:
+            return PRIMARY
+        alias = random.choice(replicas)
+        used = _used_replicas.get()
+        if alias not in used:
+            _used_replicas.set(used + (alias,))
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive schema changes through replication
+        return db == PRIMARY
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 import os
 import dj_database_url
+from corsheaders.defaults import default_headers
 from dotenv import load_dotenv
 
 # Load environment variables from .env file if it exists
@@ -36,6 +37,7 @@ ALLOWED_HOSTS = ['tripwise-7jbg.onrender.com', 'localhost', '127.0.0.1']
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # Only for development
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 
 # CSRF settings
 CSRF_TRUSTED_ORIGINS = ['https://tripwise-7jbg.onrender.com', 
@@ -59,6 +61,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,8 +83,35 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # Proxy hops in front of the app (Render adds one); only the address the last
+    # proxy appended to X-Forwarded-For identifies anonymous clients for throttling
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 1)),
+    # Token buckets for tripwise.throttling.TokenBucketThrottle, per driver or IP
+    'DEFAULT_THROTTLE_RATES': {
+        'auth': os.environ.get('THROTTLE_RATE_AUTH', '10/min'),
+        'trip_write': os.environ.get('THROTTLE_RATE_TRIP_WRITE', '30/min'),
+        'trip_read': os.environ.get('THROTTLE_RATE_TRIP_READ', '120/min'),
+        'trip_compute': os.environ.get('THROTTLE_RATE_TRIP_COMPUTE', '20/min'),
+    },
 }
 
+# Cache used for rate limiting and planner distance matrices. Local memory is
+# per process; set CACHE_DIR to share state between workers on one host.
+CACHE_DIR = os.environ.get('CACHE_DIR')
+if CACHE_DIR:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': CACHE_DIR,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 ROOT_URLCONF = 'core.urls'
 
 TEMPLATES = [
@@ -113,6 +143,53 @@ DATABASES = {
     'default': dj_database_url.parse(DATABASE_URL, conn_max_age=600)
 }
 
+# Optional read replicas as a comma-separated list of database URLs. Reads are
+# routed to them by core.routers.PrimaryReplicaRouter; to try it locally, copy
+# a migrated db.sqlite3 to replica.sqlite3 and set
+# DATABASE_REPLICA_URLS=sqlite:///replica.sqlite3
+DATABASE_REPLICA_URLS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+# Seconds to wait when connecting to a replica before treating it as down
+REPLICA_CONNECT_TIMEOUT = int(os.environ.get('REPLICA_CONNECT_TIMEOUT', 3))
+DATABASE_REPLICAS = []
+for index, replica_url in enumerate(DATABASE_REPLICA_URLS, start=1):
+    alias = f'replica_{index}'
+    DATABASES[alias] = dj_database_url.parse(replica_url, conn_max_age=600)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    if 'postgresql' in DATABASES[alias]['ENGINE']:
+        DATABASES[alias].setdefault('OPTIONS', {})['connect_timeout'] = REPLICA_CONNECT_TIMEOUT
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter'] if DATABASE_REPLICAS else []
+
+# Seconds a client keeps reading from the primary after a write
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+# Replicas further behind than this are skipped
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))
+# How often healthy / failed replicas are re-checked
+REPLICA_HEALTH_CHECK_SECONDS = int(os.environ.get('REPLICA_HEALTH_CHECK_SECONDS', 5))
+REPLICA_RETRY_SECONDS = int(os.environ.get('REPLICA_RETRY_SECONDS', 30))
+
+# How long a trip save can be replayed by retrying with the same idempotency key
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 60 * 60 * 24))
+
+# Limits applied to trip uploads before the JSON body is parsed
+TRIP_MAX_BODY_BYTES = int(os.environ.get('TRIP_MAX_BODY_BYTES', 512 * 1024))
+TRIP_MAX_JSON_DEPTH = int(os.environ.get('TRIP_MAX_JSON_DEPTH', 16))
+
+# Trips older than this many days are moved to the compressed archive table by
+# the archive_trips command; set TRIP_ARCHIVE_CODEC=zstd if zstandard is installed
+TRIP_ARCHIVE_AFTER_DAYS = int(os.environ.get('TRIP_ARCHIVE_AFTER_DAYS', 365))
+TRIP_ARCHIVE_CODEC = os.environ.get('TRIP_ARCHIVE_CODEC', 'zlib')
+
+# Changes feed: how far the sync watermark trails the clock, the page size, and
+# how long deletion tombstones are kept (older tokens must do a full resync)
+TRIP_SYNC_SAFETY_SECONDS = int(os.environ.get('TRIP_SYNC_SAFETY_SECONDS', 5))
+TRIP_SYNC_PAGE_SIZE = int(os.environ.get('TRIP_SYNC_PAGE_SIZE', 200))
+TRIP_TOMBSTONE_RETENTION_DAYS = int(os.environ.get('TRIP_TOMBSTONE_RETENTION_DAYS', 90))
+
+# Where fix_driver_table caches the fingerprint of the last verified schema
+SCHEMA_FINGERPRINT_PATH = os.environ.get('SCHEMA_FINGERPRINT_PATH', BASE_DIR / '.schema_fingerprint')
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
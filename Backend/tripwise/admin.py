@@ -1,7 +1,90 @@
 from django.contrib import admin
+from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+
 from .models import Driver, Trip
 
+# Tables larger than this show an estimated count instead of running COUNT(*)
+ESTIMATED_COUNT_THRESHOLD = 100_000
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that uses the planner's row estimate for large unfiltered tables"""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] > ESTIMATED_COUNT_THRESHOLD:
+                return row[0]
+        return super().count
+
+
+class ExactIdSearchMixin:
+    """Search with exact, index-friendly matches instead of icontains scans"""
+    exact_search_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        matches = queryset.none()
+        for field in self.exact_search_fields:
+            if field == 'id' and not search_term.isdigit():
+                continue
+            matches |= queryset.filter(**{field: search_term})
+        return matches, False
+
+
+@admin.register(Driver)
+class DriverAdmin(ExactIdSearchMixin, UserAdmin):
+    list_display = ('id', 'username', 'email', 'is_staff', 'date_joined')
+    list_filter = ('is_staff', 'is_active')
+    search_fields = ('username',)  # Enables the search box; see exact_search_fields
+    exact_search_fields = ('id', 'username', 'email')
+    ordering = ('-id',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(Trip)
+class TripAdmin(ExactIdSearchMixin, admin.ModelAdmin):
+    list_display = ('id', 'driver', 'created_at', 'day_count', 'total_miles', 'stop_count')
+    list_filter = ('created_at',)
+    search_fields = ('user_id',)  # Enables the search box; see exact_search_fields
+    exact_search_fields = ('id', 'user_id')
+    ordering = ('-created_at',)
+    readonly_fields = ('created_at', 'updated_at', 'day_count', 'total_miles', 'stop_count')
+    exclude = ('log_bitmap', 'log_side_table')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+    # Never load the large JSON columns for the changelist
+    deferred_fields = ('daily_logs', 'rest_stops', 'route_data', 'trip_details', 'notes',
+                       'log_bitmap', 'log_side_table')
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if request.resolver_match and request.resolver_match.url_name.endswith('_changelist'):
+            queryset = queryset.defer(*self.deferred_fields)
+        return queryset
 
-# Register your models here.
-admin.site.register(Driver)
-admin.site.register(Trip)
\ No newline at end of file
+    @admin.display(description='Driver', ordering='user_id')
+    def driver(self, trip):
+        # user_id is a plain column, so link straight to the driver by id
+        if not trip.user_id.isdigit():
+            return trip.user_id
+        url = reverse('admin:tripwise_driver_change', args=[trip.user_id])
+        return format_html('<a href="{}">{}</a>', url, trip.user_id)
@@ -0,0 +1,47 @@
+"""
+Compression for archived trips.
+
+Archived trips keep their JSON columns as a single compressed blob. zlib is
+always available; zstd is used when the optional ``zstandard`` package is
+installed and TRIP_ARCHIVE_CODEC asks for it.
+"""
+import json
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+ZLIB = 'zlib'
+ZSTD = 'zstd'
+ZLIB_LEVEL = 9
+ZSTD_LEVEL = 10
+
+
+def available_codec(preferred):
+    """Return the preferred codec if it can be used, otherwise zlib."""
+    if preferred == ZSTD and zstandard is not None:
+        return ZSTD
+    return ZLIB
+
+
+def compress_payload(payload, codec=ZLIB):
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    if codec == ZSTD:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    if codec == ZLIB:
+        return zlib.compress(raw, ZLIB_LEVEL)
+    raise ValueError(f'Unknown archive codec: {codec}')
+
+
+def decompress_payload(blob, codec):
+    if codec == ZSTD:
+        if zstandard is None:
+            raise RuntimeError('zstandard is required to read zstd-archived trips')
+        raw = zstandard.ZstdDecompressor().decompress(blob)
+    elif codec == ZLIB:
+        raw = zlib.decompress(blob)
+    else:
+        raise ValueError(f'Unknown archive codec: {codec}')
+    return json.loads(raw)
@@ -0,0 +1,295 @@
+"""
+Hours of Service audit engine for stored daily logs.
+
+Every DailyLog is expanded into a 1440-slot array of duty status codes (one
+slot per minute) and a driver's whole history is laid out as one contiguous
+minute array, so each HOS rule becomes a handful of NumPy vector operations.
+Days missing from the history are treated as off duty.
+
+This module deliberately has no Django imports so that process pool workers
+can import it cheaply.
+"""
+import datetime
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Two-bit duty status codes
+OFF_DUTY = 0
+SLEEPER = 1
+DRIVING = 2
+ON_DUTY = 3
+
+STATUS_CODES = {
+    'off-duty': OFF_DUTY,
+    'sleeper': SLEEPER,
+    'driving': DRIVING,
+    'on-duty': ON_DUTY,
+}
+
+MINUTES_PER_DAY = 1440
+
+# HOS limits in minutes
+MAX_DRIVING_MINUTES = 11 * 60
+MAX_WINDOW_MINUTES = 14 * 60
+MIN_OFF_DUTY_MINUTES = 10 * 60
+# Rests this long end a shift even when they fall short of the 10 hours off;
+# split sleeper berth pairings are not modelled
+SHIFT_REST_MINUTES = 8 * 60
+REQUIRED_BREAK_MINUTES = 30
+MAX_DRIVING_BEFORE_BREAK = 8 * 60
+CYCLE_RESTART_MINUTES = 34 * 60
+
+# Cycle name -> (on-duty limit in minutes, window length in days)
+CYCLE_LIMITS = {
+    '60-hour/7-day': (60 * 60, 7),
+    '70-hour/8-day': (70 * 60, 8),
+}
+DEFAULT_CYCLE = '70-hour/8-day'
+
+RULE_DRIVING_11 = 'driving_11_hour'
+RULE_WINDOW_14 = 'window_14_hour'
+RULE_BREAK_30 = 'break_30_minute'
+RULE_OFF_DUTY_10 = 'off_duty_10_hour'
+RULE_CYCLE = 'cycle_limit'
+
+
+def parse_minute(value):
+    """Convert an "HH:MM" time (up to "24:00") to minutes after midnight."""
+    hours, minutes = value.split(':')
+    minute = int(hours) * 60 + int(minutes)
+    if not 0 <= minute <= MINUTES_PER_DAY:
+        raise ValueError(f'Time out of range: {value}')
+    return minute
+
+
+def format_minute(minute):
+    """Convert minutes after midnight back to "HH:MM"."""
+    return f'{minute // 60:02d}:{minute % 60:02d}'
+
+
+def expand_daily_log(daily_log):
+    """Expand a DailyLog dict into a 1440-slot uint8 array of status codes.
+
+    Entries with unknown statuses or malformed times are skipped, which leaves
+    those minutes off duty.
+    """
+    day = np.zeros(MINUTES_PER_DAY, dtype=np.uint8)
+    for entry in daily_log.get('logs') or []:
+        try:
+            start = parse_minute(entry['startTime'])
+            end = parse_minute(entry['endTime'])
+            code = STATUS_CODES[entry['status']]
+        except (KeyError, TypeError, ValueError, AttributeError):
+            continue
+        day[start:end] = code
+    return day
+
+
+def expand_days(daily_logs):
+    """Yield ``(date, minutes)`` pairs for a list of DailyLog dicts."""
+    for daily_log in daily_logs:
+        if isinstance(daily_log, dict):
+            yield daily_log.get('date'), expand_daily_log(daily_log)
+
+
+def build_history(days):
+    """Lay out a driver's days as one contiguous minute array.
+
+    ``days`` is an iterable of ``(ISO date, 1440-slot array)`` pairs, as
+    produced by :func:`expand_days` or ``log_encoding.bitmap_days``. Returns a
+    ``(first_date, minutes)`` tuple, or ``(None, empty array)`` when there are
+    no usable days. Days that share a date are overlaid in order, with duty
+    minutes taking precedence over off-duty minutes.
+    """
+    by_date = {}
+    for date, day in days:
+        try:
+            date = datetime.date.fromisoformat(date)
+        except (TypeError, ValueError):
+            continue
+        if date in by_date:
+            day = np.where(day != OFF_DUTY, day, by_date[date])
+        by_date[date] = day
+
+    if not by_date:
+        return None, np.zeros(0, dtype=np.uint8)
+
+    first_date = min(by_date)
+    day_count = (max(by_date) - first_date).days + 1
+    minutes = np.zeros((day_count, MINUTES_PER_DAY), dtype=np.uint8)
+    for date, day in by_date.items():
+        minutes[(date - first_date).days] = day
+    return first_date, minutes.reshape(-1)
+
+
+def _run_starts(mask):
+    """Index of the first minute of the run of equal values each minute belongs to."""
+    index = np.arange(mask.size)
+    boundary = np.empty(mask.size, dtype=bool)
+    boundary[0] = True
+    boundary[1:] = mask[1:] != mask[:-1]
+    return np.maximum.accumulate(np.where(boundary, index, 0))
+
+
+def _resets(rest, minimum, run_starts=None):
+    """Mark the first minute after a rest run of at least ``minimum`` minutes.
+
+    The history is assumed to be preceded by a full rest, so a leading rest
+    run (or leading duty) always counts as a reset.
+    """
+    if run_starts is None:
+        run_starts = _run_starts(rest)
+    index = np.arange(rest.size)
+    reset = np.zeros(rest.size, dtype=bool)
+    reset[0] = not rest[0]
+    rest_length = index[1:] - run_starts[:-1]
+    reset[1:] = (
+        ~rest[1:] & rest[:-1]
+        & ((rest_length >= minimum) | (run_starts[:-1] == 0))
+    )
+    return reset
+
+
+def _segment_starts(reset):
+    """Forward-fill the index of the most recent reset for every minute."""
+    index = np.arange(reset.size)
+    return np.maximum.accumulate(np.where(reset, index, 0))
+
+
+def _intervals(mask):
+    """Return ``(starts, ends)`` of the contiguous True runs in a boolean array."""
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    return edges[::2], edges[1::2]
+
+
+def audit_minutes(minutes, cycle=DEFAULT_CYCLE):
+    """Run every HOS rule over a contiguous minute array.
+
+    Returns a dict mapping rule name to a boolean mask of the offending minutes.
+    """
+    size = minutes.size
+    index = np.arange(size)
+    rest = minutes <= SLEEPER
+    driving = minutes == DRIVING
+    duty = ~rest
+
+    driving_total = np.cumsum(driving, dtype=np.int64)
+    driving_before = driving_total - driving
+    duty_total = np.cumsum(duty, dtype=np.int64)
+    duty_before = duty_total - duty
+
+    rest_starts = _run_starts(rest)
+
+    # 11-hour driving and 14-hour window, measured from the last 10 hours off
+    shift_start = _segment_starts(_resets(rest, MIN_OFF_DUTY_MINUTES, rest_starts))
+    driven_in_shift = driving_total - driving_before[shift_start]
+    driving_11 = driving & (driven_in_shift > MAX_DRIVING_MINUTES)
+    window_14 = driving & (index - shift_start >= MAX_WINDOW_MINUTES)
+
+    # 30-minute break after 8 cumulative hours of driving
+    not_driving = ~driving
+    break_start = _segment_starts(_resets(not_driving, REQUIRED_BREAK_MINUTES))
+    driven_since_break = driving_total - driving_before[break_start]
+    break_30 = driving & (driven_since_break > MAX_DRIVING_BEFORE_BREAK)
+
+    # 10 hours off: driving in a shift that began after a rest shorter than 10 hours
+    run_begins, run_ends = _intervals(rest)
+    run_lengths = run_ends - run_begins
+    shift_rests = (run_lengths >= SHIFT_REST_MINUTES) & (run_ends < size)
+    shift_begins = np.zeros(size, dtype=bool)
+    shift_begins[run_ends[shift_rests]] = True
+    short_rest = np.zeros(size, dtype=bool)
+    short_rest[run_ends[shift_rests]] = (
+        (run_lengths[shift_rests] < MIN_OFF_DUTY_MINUTES) & (run_begins[shift_rests] > 0)
+    )
+    off_duty_10 = driving & short_rest[_segment_starts(shift_begins)]
+
+    # 60/70-hour cycle with a 34-hour restart
+    limit, window_days = CYCLE_LIMITS.get(cycle, CYCLE_LIMITS[DEFAULT_CYCLE])
+    restart_start = _segment_starts(_resets(rest, CYCLE_RESTART_MINUTES, rest_starts))
+    window_start = np.maximum(index - window_days * MINUTES_PER_DAY + 1, restart_start)
+    on_duty_in_window = duty_total - duty_before[window_start]
+    cycle_limit = driving & (on_duty_in_window > limit)
+
+    return {
+        RULE_DRIVING_11: driving_11,
+        RULE_WINDOW_14: window_14,
+        RULE_BREAK_30: break_30,
+        RULE_OFF_DUTY_10: off_duty_10,
+        RULE_CYCLE: cycle_limit,
+    }
+
+
+def audit_days(days, cycle=DEFAULT_CYCLE):
+    """Audit one driver's ``(date, minutes)`` days and return a JSON-serialisable report."""
+    first_date, minutes = build_history(days)
+    if first_date is None:
+        return {'days': 0, 'compliant': True, 'violations': [],
+                'status_minutes': dict.fromkeys(STATUS_CODES, 0)}
+
+    violations = []
+    for rule, mask in audit_minutes(minutes, cycle).items():
+        starts, ends = _intervals(mask)
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            day, minute = divmod(start, MINUTES_PER_DAY)
+            violations.append({
+                'rule': rule,
+                'date': (first_date + datetime.timedelta(days=day)).isoformat(),
+                'start': format_minute(minute),
+                'minutes': end - start,
+            })
+    violations.sort(key=lambda violation: (violation['date'], violation['start'], violation['rule']))
+
+    totals = np.bincount(minutes, minlength=len(STATUS_CODES)).tolist()
+    return {
+        'days': minutes.size // MINUTES_PER_DAY,
+        'compliant': not violations,
+        'violations': violations,
+        'status_minutes': {name: totals[code] for name, code in STATUS_CODES.items()},
+    }
+
+
+def audit_driver(daily_logs, cycle=DEFAULT_CYCLE):
+    """Audit one driver's DailyLog dicts and return a JSON-serialisable report."""
+    return audit_days(expand_days(daily_logs), cycle)
+
+
+def load_histories(trips):
+    """Group trip rows into per-driver histories.
+
+    ``trips`` is an iterable of ``(user_id, trip_details, days)`` tuples
+    ordered by creation time, where ``days`` holds ``(date, minutes)`` pairs;
+    the cycle of a driver's latest trip wins. Returns a dict of
+    ``user_id -> (cycle, days)``.
+    """
+    histories = {}
+    for user_id, trip_details, days in trips:
+        cycle, history = histories.get(user_id, (DEFAULT_CYCLE, []))
+        if isinstance(trip_details, dict):
+            cycle = trip_details.get('currentCycle') or cycle
+        history.extend(days)
+        histories[user_id] = (cycle, history)
+    return histories
+
+
+def _audit_history(item):
+    user_id, (cycle, days) = item
+    return user_id, audit_days(days, cycle)
+
+
+def audit_fleet(histories, workers=None):
+    """Audit many drivers, fanning out across a process pool.
+
+    ``histories`` is the dict returned by :func:`load_histories`. With a single
+    worker (or a single driver) everything runs in-process.
+    """
+    workers = workers or os.cpu_count() or 1
+    items = list(histories.items())
+    if workers == 1 or len(items) <= 1:
+        return dict(map(_audit_history, items))
+
+    chunksize = max(1, len(items) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return dict(executor.map(_audit_history, items, chunksize=chunksize))
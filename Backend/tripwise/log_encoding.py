@@ -0,0 +1,146 @@
+"""
+Compact encoding of duty-status days.
+
+A day is stored as 1440 two-bit status codes packed four to a byte (360 bytes),
+using the same codes as the HOS audit engine. Everything that is not a status
+lives in a side table: the day's own keys, each entry's start and end minute
+and an index into a per-trip list of distinct locations. An entry's status is
+only stored when the bitmap cannot recover it (empty or overwritten entries),
+and any other keys it has are kept verbatim. Days and entries that do not
+encode cleanly (unknown statuses, non-canonical times, non-dict values) are
+kept verbatim too, so ``decode_daily_logs(*encode_daily_logs(x)) == x``.
+"""
+import numpy as np
+
+from .hos_audit import MINUTES_PER_DAY, STATUS_CODES, expand_daily_log, format_minute, parse_minute
+
+BYTES_PER_DAY = MINUTES_PER_DAY // 4
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+_SHIFTS = np.array([6, 4, 2, 0], dtype=np.uint8)
+# Minutes spent in each status for every possible packed byte
+_BYTE_TOTALS = np.stack(
+    [(((np.arange(256)[:, None] >> _SHIFTS) & 3) == code).sum(axis=1) for code in range(4)],
+    axis=1,
+).astype(np.int16)
+
+
+def pack_days(days):
+    """Pack a ``(days, 1440)`` array of status codes into bytes."""
+    codes = np.asarray(days, dtype=np.uint8).reshape(-1, BYTES_PER_DAY, 4)
+    return (codes << _SHIFTS).sum(axis=2, dtype=np.uint8).tobytes()
+
+
+def unpack_days(bitmap):
+    """Unpack bytes produced by :func:`pack_days` into a ``(days, 1440)`` array."""
+    packed = np.frombuffer(bitmap, dtype=np.uint8).reshape(-1, BYTES_PER_DAY)
+    return ((packed[:, :, None] >> _SHIFTS) & 3).reshape(-1, MINUTES_PER_DAY)
+
+
+def day_totals(bitmap):
+    """Minutes per status for each encoded day as a ``(days, 4)`` array.
+
+    Uses a per-byte lookup table, so the cost per day is fixed regardless of
+    how many log entries the day had.
+    """
+    packed = np.frombuffer(bitmap, dtype=np.uint8).reshape(-1, BYTES_PER_DAY)
+    return _BYTE_TOTALS[packed].sum(axis=1)
+
+
+def bitmap_days(bitmap, side_table):
+    """``(date, minutes)`` pairs for the HOS audit, read from the encoding alone."""
+    # Side tables written before the dict format are a plain list of day rows
+    rows = side_table['days'] if isinstance(side_table, dict) else side_table
+    dates = [(row.get('fields') or row).get('date') for row in rows]
+    return list(zip(dates, unpack_days(bitmap)))
+
+
+_ENTRY_KEYS = ('startTime', 'endTime', 'status', 'location')
+
+
+def _canonical_minute(value):
+    """Minute for an "HH:MM" string that formats back to itself, else None."""
+    try:
+        minute = parse_minute(value)
+    except (TypeError, ValueError, AttributeError):
+        return None
+    return minute if format_minute(minute) == value else None
+
+
+def _encode_entry(entry, day, locations):
+    if not isinstance(entry, dict):
+        return {'raw': entry}
+    start = _canonical_minute(entry.get('startTime'))
+    end = _canonical_minute(entry.get('endTime'))
+    code = STATUS_CODES.get(entry.get('status'))
+    if start is None or end is None or code is None:
+        return {'raw': entry}
+
+    extras = {key: value for key, value in entry.items() if key not in _ENTRY_KEYS}
+    # Empty or overwritten entries keep their status in the side table
+    if start >= end or (day[start:end] != code).any():
+        extras['status'] = entry['status']
+    location = entry.get('location')
+    if isinstance(location, str):
+        location = locations.setdefault(location, len(locations))
+    else:
+        if 'location' in entry:
+            extras['location'] = location
+        location = None
+    row = [start, end, location]
+    if extras:
+        row.append(extras)
+    return row
+
+
+def encode_daily_logs(daily_logs):
+    """Encode a trip's ``daily_logs`` list into ``(bitmap, side_table)``."""
+    days = np.zeros((len(daily_logs), MINUTES_PER_DAY), dtype=np.uint8)
+    locations = {}
+    rows = []
+    for position, daily_log in enumerate(daily_logs):
+        if not isinstance(daily_log, dict):
+            rows.append({'raw': daily_log})
+            continue
+        days[position] = expand_daily_log(daily_log)
+        logs = daily_log.get('logs')
+        if not isinstance(logs, list):
+            rows.append({'fields': daily_log})
+            continue
+        rows.append({
+            'fields': {key: value for key, value in daily_log.items() if key != 'logs'},
+            'entries': [_encode_entry(entry, days[position], locations) for entry in logs],
+        })
+    return pack_days(days), {'locations': list(locations), 'days': rows}
+
+
+def _decode_entry(row, day, locations):
+    if isinstance(row, dict):
+        return row['raw']
+    start, end, location, *extras = row
+    extras = extras[0] if extras else {}
+    entry = {
+        'startTime': format_minute(start),
+        'endTime': format_minute(end),
+        'status': extras.get('status') or STATUS_NAMES[int(day[start])],
+    }
+    if location is not None:
+        entry['location'] = locations[location]
+    entry.update((key, value) for key, value in extras.items() if key != 'status')
+    return entry
+
+
+def decode_daily_logs(bitmap, side_table):
+    """Rebuild the ``daily_logs`` list from :func:`encode_daily_logs` output."""
+    days = unpack_days(bitmap)
+    locations = side_table['locations']
+    daily_logs = []
+    for day, row in zip(days, side_table['days']):
+        if 'raw' in row:
+            daily_logs.append(row['raw'])
+            continue
+        daily_log = dict(row['fields'])
+        if 'entries' in row:
+            daily_log['logs'] = [_decode_entry(entry, day, locations) for entry in row['entries']]
+        daily_logs.append(daily_log)
+    return daily_logs
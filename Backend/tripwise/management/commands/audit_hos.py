@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tripwise.hos_audit import audit_fleet, load_histories
+from tripwise.models import audit_rows
+
+
+class Command(BaseCommand):
+    help = 'Audits stored daily logs against the Hours of Service rules'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only audit the trips of this user id')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of worker processes (defaults to the CPU count)')
+        parser.add_argument('--benchmark', action='store_true',
+                            help='Report audit throughput in driver-days per second')
+        parser.add_argument('--verbose-violations', action='store_true',
+                            help='Print every violation instead of per-driver counts')
+
+    def handle(self, *args, **options):
+        histories = load_histories(audit_rows(options['user']))
+
+        started = time.perf_counter()
+        reports = audit_fleet(histories, workers=options['workers'])
+        elapsed = time.perf_counter() - started
+
+        for user_id, report in sorted(reports.items()):
+            if report['compliant']:
+                self.stdout.write(f"User {user_id}: {report['days']} days, compliant")
+                continue
+            self.stdout.write(self.style.WARNING(
+                f"User {user_id}: {report['days']} days, {len(report['violations'])} violations"
+            ))
+            if options['verbose_violations']:
+                for violation in report['violations']:
+                    self.stdout.write(
+                        f"  {violation['date']} {violation['start']} "
+                        f"{violation['rule']} ({violation['minutes']} min)"
+                    )
+
+        if options['benchmark']:
+            driver_days = sum(report['days'] for report in reports.values())
+            rate = driver_days / elapsed if elapsed else 0.0
+            self.stdout.write(
+                f'Audited {len(reports)} drivers / {driver_days} driver-days '
+                f'in {elapsed:.3f}s ({rate:,.0f} driver-days/sec)'
+            )
+
+        self.stdout.write(self.style.SUCCESS('HOS audit completed'))
@@ -0,0 +1,87 @@
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from tripwise.hos_audit import expand_daily_log
+from tripwise.log_encoding import day_totals, decode_daily_logs, encode_daily_logs
+from tripwise.models import Trip
+
+
+class Command(BaseCommand):
+    help = 'Backfills the compact minute-bitmap encoding of every trip\'s daily logs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of trips updated per query')
+        parser.add_argument('--all', action='store_true',
+                            help='Re-encode trips that already have a bitmap')
+        parser.add_argument('--benchmark', action='store_true',
+                            help='Compare size and CPU cost of the JSON and bitmap formats instead of writing')
+
+    def handle(self, *args, **options):
+        trips = Trip.objects.order_by('id')
+        if not options['all']:
+            trips = trips.filter(log_bitmap__isnull=True)
+
+        if options['benchmark']:
+            self._benchmark(trips)
+            return
+
+        batch = []
+        updated = 0
+        for trip in trips.only('id', 'daily_logs').iterator(chunk_size=options['batch_size']):
+            trip.encode_logs()
+            batch.append(trip)
+            if len(batch) >= options['batch_size']:
+                updated += Trip.objects.bulk_update(batch, ['log_bitmap', 'log_side_table'])
+                batch = []
+        if batch:
+            updated += Trip.objects.bulk_update(batch, ['log_bitmap', 'log_side_table'])
+
+        self.stdout.write(self.style.SUCCESS(f'Encoded daily logs for {updated} trips'))
+
+    def _benchmark(self, trips):
+        all_logs = [logs for logs in trips.values_list('daily_logs', flat=True) if isinstance(logs, list)]
+        day_count = sum(len(logs) for logs in all_logs)
+        if not day_count:
+            self.stdout.write('No daily logs to benchmark')
+            return
+
+        json_bytes = sum(len(json.dumps(logs).encode()) for logs in all_logs)
+
+        started = time.perf_counter()
+        encoded = [encode_daily_logs(logs) for logs in all_logs]
+        encode_time = time.perf_counter() - started
+
+        bitmap_bytes = sum(len(bitmap) for bitmap, _ in encoded)
+        side_bytes = sum(len(json.dumps(side_table).encode()) for _, side_table in encoded)
+
+        started = time.perf_counter()
+        for bitmap, side_table in encoded:
+            decode_daily_logs(bitmap, side_table)
+        decode_time = time.perf_counter() - started
+
+        # Status totals: parsing the JSON strings vs the byte lookup table
+        started = time.perf_counter()
+        for logs in all_logs:
+            for daily_log in logs:
+                if isinstance(daily_log, dict):
+                    np.bincount(expand_daily_log(daily_log), minlength=4)
+        parse_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for bitmap, _ in encoded:
+            day_totals(bitmap)
+        totals_time = time.perf_counter() - started
+
+        self.stdout.write(f'Trips: {len(all_logs)}, days: {day_count}')
+        self.stdout.write(f'JSON daily_logs: {json_bytes:,} bytes ({json_bytes / day_count:,.0f} per day)')
+        self.stdout.write(
+            f'Bitmap + side table: {bitmap_bytes:,} + {side_bytes:,} bytes '
+            f'({(bitmap_bytes + side_bytes) / day_count:,.0f} per day)'
+        )
+        for label, elapsed in (('Encode', encode_time), ('Decode', decode_time),
+                               ('Totals from JSON', parse_time), ('Totals from bitmap', totals_time)):
+            self.stdout.write(f'{label}: {elapsed * 1e6 / day_count:,.1f} us per day')
@@ -1,171 +1,257 @@
-from django.core.management.base import BaseCommand
-from django.db import connection
+import hashlib
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+# Column types per database vendor
+TYPES = {
+    'postgresql': {
+        'serial_pk': 'SERIAL PRIMARY KEY',
+        'int': 'INTEGER',
+        'float': 'DOUBLE PRECISION',
+        'bool': 'BOOLEAN',
+        'text': 'TEXT',
+        'json': 'JSONB',
+        'bytes': 'BYTEA',
+        'timestamp': 'TIMESTAMP WITH TIME ZONE',
+    },
+    'sqlite': {
+        'serial_pk': 'INTEGER PRIMARY KEY AUTOINCREMENT',
+        'int': 'INTEGER',
+        'float': 'REAL',
+        'bool': 'BOOL',
+        'text': 'TEXT',
+        'json': 'TEXT',
+        'bytes': 'BLOB',
+        'timestamp': 'DATETIME',
+    },
+}
+
+DEFAULTS = {
+    'postgresql': {'now': 'NOW()', 'true': 'TRUE', 'false': 'FALSE'},
+    'sqlite': {'now': 'CURRENT_TIMESTAMP', 'true': '1', 'false': '0'},
+}
+
+# One catalog query returning (table, column) for every column of the given tables
+CATALOG_QUERIES = {
+    'postgresql': """
+        SELECT cl.relname, a.attname
+        FROM pg_attribute a
+        JOIN pg_class cl ON cl.oid = a.attrelid
+        JOIN pg_namespace n ON n.oid = cl.relnamespace
+        WHERE n.nspname = current_schema()
+          AND cl.relkind = 'r'
+          AND cl.relname = ANY(%s)
+          AND a.attnum > 0
+          AND NOT a.attisdropped
+    """,
+    'sqlite': """
+        SELECT m.name, p.name
+        FROM sqlite_master AS m
+        JOIN pragma_table_info(m.name) AS p
+        WHERE m.type = 'table' AND m.name IN ({placeholders})
+    """,
+}
+
+# Expected schema, in creation order: table -> (columns, table constraints).
+# Column options may use {now}, {true} and {false} for vendor-specific defaults.
+SCHEMA = {
+    'django_content_type': (
+        [
+            ('id', 'serial_pk', ''),
+            ('app_label', 'VARCHAR(100)', 'NOT NULL'),
+            ('model', 'VARCHAR(100)', 'NOT NULL'),
+        ],
+        ['CONSTRAINT django_content_type_app_label_model_uniq UNIQUE (app_label, model)'],
+    ),
+    'auth_permission': (
+        [
+            ('id', 'serial_pk', ''),
+            ('name', 'VARCHAR(255)', 'NOT NULL'),
+            ('content_type_id', 'int', 'NOT NULL REFERENCES django_content_type(id)'),
+            ('codename', 'VARCHAR(100)', 'NOT NULL'),
+        ],
+        ['CONSTRAINT auth_permission_content_type_id_codename_uniq UNIQUE (content_type_id, codename)'],
+    ),
+    'auth_group': (
+        [
+            ('id', 'serial_pk', ''),
+            ('name', 'VARCHAR(150)', 'NOT NULL UNIQUE'),
+        ],
+        [],
+    ),
+    'auth_group_permissions': (
+        [
+            ('id', 'serial_pk', ''),
+            ('group_id', 'int', 'NOT NULL REFERENCES auth_group(id)'),
+            ('permission_id', 'int', 'NOT NULL REFERENCES auth_permission(id)'),
+        ],
+        ['CONSTRAINT auth_group_permissions_group_id_permission_id_uniq UNIQUE (group_id, permission_id)'],
+    ),
+    'tripwise_driver': (
+        [
+            ('id', 'serial_pk', ''),
+            ('password', 'VARCHAR(250)', 'NOT NULL'),
+            ('last_login', 'timestamp', 'NULL'),
+            ('is_superuser', 'bool', 'NOT NULL DEFAULT {false}'),
+            ('username', 'VARCHAR(250)', 'NOT NULL UNIQUE'),
+            ('first_name', 'VARCHAR(150)', "NOT NULL DEFAULT ''"),
+            ('last_name', 'VARCHAR(150)', "NOT NULL DEFAULT ''"),
+            ('email', 'VARCHAR(250)', 'NOT NULL UNIQUE'),
+            ('is_staff', 'bool', 'NOT NULL DEFAULT {false}'),
+            ('is_active', 'bool', 'NOT NULL DEFAULT {true}'),
+            ('date_joined', 'timestamp', 'NOT NULL DEFAULT {now}'),
+        ],
+        [],
+    ),
+    'tripwise_driver_groups': (
+        [
+            ('id', 'serial_pk', ''),
+            ('driver_id', 'int', 'NOT NULL REFERENCES tripwise_driver(id) ON DELETE CASCADE'),
+            ('group_id', 'int', 'NOT NULL REFERENCES auth_group(id) ON DELETE CASCADE'),
+        ],
+        ['CONSTRAINT tripwise_driver_groups_driver_id_group_id_uniq UNIQUE (driver_id, group_id)'],
+    ),
+    'tripwise_driver_user_permissions': (
+        [
+            ('id', 'serial_pk', ''),
+            ('driver_id', 'int', 'NOT NULL REFERENCES tripwise_driver(id) ON DELETE CASCADE'),
+            ('permission_id', 'int', 'NOT NULL REFERENCES auth_permission(id) ON DELETE CASCADE'),
+        ],
+        ['CONSTRAINT tripwise_driver_user_permissions_driver_id_permission_id_uniq UNIQUE (driver_id, permission_id)'],
+    ),
+    'tripwise_trip': (
+        [
+            ('id', 'serial_pk', ''),
+            ('user_id', 'VARCHAR(255)', 'NOT NULL'),
+            ('created_at', 'timestamp', 'NOT NULL DEFAULT {now}'),
+            ('updated_at', 'timestamp', 'NOT NULL DEFAULT {now}'),
+            ('daily_logs', 'json', 'NOT NULL'),
+            ('notes', 'text', 'NULL'),
+            ('rest_stops', 'json', 'NOT NULL'),
+            ('route_data', 'json', 'NOT NULL'),
+            ('trip_details', 'json', 'NOT NULL'),
+            ('log_bitmap', 'bytes', 'NULL'),
+            ('log_side_table', 'json', 'NULL'),
+            ('day_count', 'int', 'NOT NULL DEFAULT 0'),
+            ('total_miles', 'float', 'NOT NULL DEFAULT 0'),
+            ('stop_count', 'int', 'NOT NULL DEFAULT 0'),
+        ],
+        [],
+    ),
+}
+
 
 class Command(BaseCommand):
     help = 'Fixes the tripwise_driver table schema by adding missing columns or creating tables from scratch'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only print the missing schema changes; exit with an error if any')
+        parser.add_argument('--force', action='store_true',
+                            help='Ignore the cached schema fingerprint')
+
     def handle(self, *args, **options):
-        self.stdout.write('Starting to fix the database schema...')
-        
+        vendor = connection.vendor
+        if vendor not in CATALOG_QUERIES:
+            raise CommandError(f'Unsupported database backend: {vendor}')
+
+        existing = self._introspect(vendor)
+        fingerprint = self._fingerprint(existing)
+        if not options['force'] and fingerprint == self._cached_fingerprint():
+            self.stdout.write(self.style.SUCCESS('Database schema unchanged, nothing to do'))
+            return
+
+        statements = self._missing_statements(vendor, existing)
+        if not statements:
+            self._store_fingerprint(fingerprint)
+            self.stdout.write(self.style.SUCCESS('Database schema is up to date'))
+            return
+
+        if options['dry_run']:
+            for statement in statements:
+                self.stdout.write(statement)
+            raise CommandError(f'{len(statements)} schema changes are missing')
+
+        self.stdout.write(f'Applying {len(statements)} schema changes...')
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+
+        self._store_fingerprint(self._fingerprint(self._introspect(vendor)))
+        self.stdout.write(self.style.SUCCESS('Database schema fix completed successfully!'))
+
+    def _introspect(self, vendor):
+        """Return {table: set(columns)} for the expected tables that exist"""
+        tables = list(SCHEMA)
+        query = CATALOG_QUERIES[vendor]
         with connection.cursor() as cursor:
-            # Check if the tables exist
-            cursor.execute("SELECT to_regclass('public.tripwise_driver')")
-            driver_table_exists = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT to_regclass('public.tripwise_trip')")
-            trip_table_exists = cursor.fetchone()[0]
-            
-            # Create the auth tables if they don't exist
-            self._create_auth_tables(cursor)
-            
-            # Create or fix the Driver table
-            if not driver_table_exists:
-                self.stdout.write('Creating tripwise_driver table...')
-                self._create_driver_table(cursor)
+            if vendor == 'postgresql':
+                cursor.execute(query, [tables])
             else:
-                self.stdout.write('Fixing tripwise_driver table...')
-                self._fix_driver_table(cursor)
-            
-            # Create the Trip table if it doesn't exist
-            if not trip_table_exists:
-                self.stdout.write('Creating tripwise_trip table...')
-                self._create_trip_table(cursor)
-            
-            self.stdout.write(self.style.SUCCESS('Database schema fix completed successfully!'))
-    
-    def _create_auth_tables(self, cursor):
-        """Create the necessary auth tables if they don't exist"""
-        # Create content types table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS django_content_type (
-                id SERIAL PRIMARY KEY,
-                app_label VARCHAR(100) NOT NULL,
-                model VARCHAR(100) NOT NULL,
-                CONSTRAINT django_content_type_app_label_model_uniq UNIQUE (app_label, model)
-            )
-        """)
-        
-        # Create permissions table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS auth_permission (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(255) NOT NULL,
-                content_type_id INTEGER NOT NULL REFERENCES django_content_type(id),
-                codename VARCHAR(100) NOT NULL,
-                CONSTRAINT auth_permission_content_type_id_codename_uniq UNIQUE (content_type_id, codename)
-            )
-        """)
-        
-        # Create groups table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS auth_group (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(150) NOT NULL UNIQUE
-            )
-        """)
-        
-        # Create group permissions table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS auth_group_permissions (
-                id SERIAL PRIMARY KEY,
-                group_id INTEGER NOT NULL REFERENCES auth_group(id),
-                permission_id INTEGER NOT NULL REFERENCES auth_permission(id),
-                CONSTRAINT auth_group_permissions_group_id_permission_id_uniq UNIQUE (group_id, permission_id)
-            )
-        """)
-    
-    def _create_driver_table(self, cursor):
-        """Create the tripwise_driver table from scratch"""
-        cursor.execute("""
-            CREATE TABLE tripwise_driver (
-                id SERIAL PRIMARY KEY,
-                password VARCHAR(250) NOT NULL,
-                last_login TIMESTAMP WITH TIME ZONE NULL,
-                is_superuser BOOLEAN NOT NULL DEFAULT FALSE,
-                username VARCHAR(250) NOT NULL UNIQUE,
-                first_name VARCHAR(150) NOT NULL DEFAULT '',
-                last_name VARCHAR(150) NOT NULL DEFAULT '',
-                email VARCHAR(250) NOT NULL UNIQUE,
-                is_staff BOOLEAN NOT NULL DEFAULT FALSE,
-                is_active BOOLEAN NOT NULL DEFAULT TRUE,
-                date_joined TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
-            )
-        """)
-        
-        # Create the many-to-many tables
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS tripwise_driver_groups (
-                id SERIAL PRIMARY KEY,
-                driver_id INTEGER NOT NULL REFERENCES tripwise_driver(id) ON DELETE CASCADE,
-                group_id INTEGER NOT NULL REFERENCES auth_group(id) ON DELETE CASCADE,
-                CONSTRAINT tripwise_driver_groups_driver_id_group_id_uniq UNIQUE (driver_id, group_id)
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS tripwise_driver_user_permissions (
-                id SERIAL PRIMARY KEY,
-                driver_id INTEGER NOT NULL REFERENCES tripwise_driver(id) ON DELETE CASCADE,
-                permission_id INTEGER NOT NULL REFERENCES auth_permission(id) ON DELETE CASCADE,
-                CONSTRAINT tripwise_driver_user_permissions_driver_id_permission_id_uniq UNIQUE (driver_id, permission_id)
-            )
-        """)
-    
-    def _fix_driver_table(self, cursor):
-        """Fix the tripwise_driver table by adding missing columns"""
-        # Check if last_login column exists
-        cursor.execute("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name='tripwise_driver' AND column_name='last_login'
-        """)
-        last_login_exists = cursor.fetchone()
-        
-        if not last_login_exists:
-            self.stdout.write('Adding missing columns to tripwise_driver table...')
-            
-            # Add all the missing columns from AbstractUser
-            cursor.execute("""
-                ALTER TABLE tripwise_driver 
-                ADD COLUMN IF NOT EXISTS last_login TIMESTAMP WITH TIME ZONE NULL,
-                ADD COLUMN IF NOT EXISTS is_superuser BOOLEAN NOT NULL DEFAULT FALSE,
-                ADD COLUMN IF NOT EXISTS first_name VARCHAR(150) NOT NULL DEFAULT '',
-                ADD COLUMN IF NOT EXISTS last_name VARCHAR(150) NOT NULL DEFAULT '',
-                ADD COLUMN IF NOT EXISTS is_staff BOOLEAN NOT NULL DEFAULT FALSE,
-                ADD COLUMN IF NOT EXISTS is_active BOOLEAN NOT NULL DEFAULT TRUE,
-                ADD COLUMN IF NOT EXISTS date_joined TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
-            """)
-            
-            # Create the many-to-many tables if they don't exist
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS tripwise_driver_groups (
-                    id SERIAL PRIMARY KEY,
-                    driver_id INTEGER NOT NULL REFERENCES tripwise_driver(id) ON DELETE CASCADE,
-                    group_id INTEGER NOT NULL REFERENCES auth_group(id) ON DELETE CASCADE,
-                    CONSTRAINT tripwise_driver_groups_driver_id_group_id_uniq UNIQUE (driver_id, group_id)
-                )
-            """)
-            
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS tripwise_driver_user_permissions (
-                    id SERIAL PRIMARY KEY,
-                    driver_id INTEGER NOT NULL REFERENCES tripwise_driver(id) ON DELETE CASCADE,
-                    permission_id INTEGER NOT NULL REFERENCES auth_permission(id) ON DELETE CASCADE,
-                    CONSTRAINT tripwise_driver_user_permissions_driver_id_permission_id_uniq UNIQUE (driver_id, permission_id)
-                )
-            """)
-    
-    def _create_trip_table(self, cursor):
-        """Create the tripwise_trip table from scratch"""
-        cursor.execute("""
-            CREATE TABLE tripwise_trip (
-                id SERIAL PRIMARY KEY,
-                user_id VARCHAR(255) NOT NULL,
-                created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
-                daily_logs JSONB NOT NULL,
-                notes TEXT NULL,
-                rest_stops JSONB NOT NULL,
-                route_data JSONB NOT NULL,
-                trip_details JSONB NOT NULL
-            )
-        """)
+                cursor.execute(query.format(placeholders=', '.join(['%s'] * len(tables))), tables)
+            rows = cursor.fetchall()
+
+        existing = {}
+        for table, column in rows:
+            existing.setdefault(table, set()).add(column)
+        return existing
+
+    def _fingerprint(self, existing):
+        # The expected schema is part of the fingerprint, so changing SCHEMA
+        # invalidates fingerprints cached by older versions of this command
+        document = {
+            'vendor': connection.vendor,
+            'database': str(connection.settings_dict.get('NAME')),
+            'expected': SCHEMA,
+            'existing': {table: sorted(columns) for table, columns in sorted(existing.items())},
+        }
+        return hashlib.sha256(json.dumps(document, sort_keys=True).encode()).hexdigest()
+
+    def _missing_statements(self, vendor, existing):
+        types = TYPES[vendor]
+        statements = []
+        for table, (columns, constraints) in SCHEMA.items():
+            if table not in existing:
+                definitions = [
+                    self._column_sql(vendor, name, types.get(kind, kind), options)
+                    for name, kind, options in columns
+                ]
+                body = ',\n    '.join(definitions + constraints)
+                statements.append(f'CREATE TABLE {table} (\n    {body}\n)')
+                continue
+
+            for name, kind, options in columns:
+                if name in existing[table] or kind == 'serial_pk':
+                    continue
+                column_sql = self._column_sql(vendor, name, types.get(kind, kind), options, adding=True)
+                statements.append(f'ALTER TABLE {table} ADD COLUMN {column_sql}')
+        return statements
+
+    def _column_sql(self, vendor, name, column_type, options, adding=False):
+        defaults = dict(DEFAULTS[vendor])
+        if adding and vendor == 'sqlite':
+            # SQLite can't add UNIQUE columns or columns with non-constant defaults
+            options = options.replace(' UNIQUE', '')
+            defaults['now'] = f"'{timezone.now().strftime('%Y-%m-%d %H:%M:%S')}'"
+        return f'{name} {column_type} {options.format(**defaults)}'.rstrip()
+
+    def _fingerprint_path(self):
+        return Path(settings.SCHEMA_FINGERPRINT_PATH)
+
+    def _cached_fingerprint(self):
+        try:
+            return self._fingerprint_path().read_text().strip()
+        except OSError:
+            return None
+
+    def _store_fingerprint(self, fingerprint):
+        try:
+            self._fingerprint_path().write_text(fingerprint)
+        except OSError as exc:
+            self.stdout.write(self.style.WARNING(f'Could not cache schema fingerprint: {exc}'))
@@ -0,0 +1,82 @@
+import json
+import random
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+from tripwise.planner import PlanningError, plan_trip
+
+
+class Command(BaseCommand):
+    help = 'Plans a multi-stop trip from a JSON request file, or from random loads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('request_file', nargs='?',
+                            help='JSON planning request, as posted to /api/trip/plan/')
+        parser.add_argument('--loads', type=int, default=10,
+                            help='Random pickup/dropoff pairs to plan when no request file is given')
+        parser.add_argument('--seed', type=int, default=1,
+                            help='Random seed for generated loads')
+        parser.add_argument('--benchmark', action='store_true',
+                            help='Report planning time with a cold and a warm distance matrix cache')
+        parser.add_argument('--repeat', type=int, default=10,
+                            help='Planning runs per measurement when benchmarking')
+
+    def handle(self, *args, **options):
+        if options['request_file']:
+            try:
+                with open(options['request_file']) as request_file:
+                    request = json.load(request_file)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Could not read planning request: {exc}')
+        else:
+            request = self._random_request(options['loads'], options['seed'])
+
+        try:
+            plan = plan_trip(request)
+        except PlanningError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(
+            f"{len(plan['stopOrder'])} stops, {plan['totalDistance']:,.0f} miles, "
+            f"{len(plan['restStops'])} rest stops"
+        )
+        self.stdout.write(f"Order: {', '.join(plan['stopOrder'])}")
+
+        if options['benchmark']:
+            timings = {}
+            for label, clear_cache in (('cold cache', True), ('warm cache', False)):
+                elapsed = 0.0
+                for _ in range(options['repeat']):
+                    if clear_cache:
+                        cache.clear()
+                    started = time.perf_counter()
+                    plan_trip(request)
+                    elapsed += time.perf_counter() - started
+                timings[label] = elapsed / options['repeat']
+            self.stdout.write(', '.join(
+                f'{label}: {seconds * 1000:,.1f} ms per plan' for label, seconds in timings.items()
+            ))
+
+    def _random_request(self, loads, seed):
+        rng = random.Random(seed)
+        stops = []
+        for load in range(loads):
+            pickup_id = f'P{load}'
+            for stop_id in (pickup_id, f'D{load}'):
+                stop = {
+                    'id': stop_id,
+                    'location': stop_id,
+                    'lat': 35 + rng.uniform(-3, 3),
+                    'lon': -90 + rng.uniform(-5, 5),
+                }
+                if stop_id != pickup_id:
+                    stop['pickupId'] = pickup_id
+                stops.append(stop)
+        return {
+            'start': {'location': 'Depot', 'lat': 35, 'lon': -90},
+            'stops': stops,
+            'departureTime': '2023-06-15T06:00:00+00:00',
+            'currentCycle': '70-hour/8-day',
+        }
@@ -0,0 +1,29 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from tripwise.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Deletes idempotency keys older than IDEMPOTENCY_KEY_TTL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Number of keys deleted per query')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        expired = IdempotencyKey.objects.filter(created_at__lt=cutoff)
+
+        # Delete in batches so a large backlog doesn't hold one long lock
+        deleted = 0
+        while True:
+            ids = list(expired.values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired idempotency keys'))
@@ -0,0 +1,16 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from tripwise.models import TripTombstone
+
+
+class Command(BaseCommand):
+    help = 'Deletes trip tombstones older than TRIP_TOMBSTONE_RETENTION_DAYS'
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(days=settings.TRIP_TOMBSTONE_RETENTION_DAYS)
+        deleted, _ = TripTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired trip tombstones'))
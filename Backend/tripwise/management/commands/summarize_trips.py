@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from tripwise.models import Trip
+
+
+class Command(BaseCommand):
+    help = 'Backfills the day, mile and stop summary columns of every trip'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of trips updated per query')
+        parser.add_argument('--all', action='store_true',
+                            help='Re-summarize trips that already have summaries')
+
+    def handle(self, *args, **options):
+        trips = Trip.objects.order_by('id')
+        if not options['all']:
+            # Columns added by migration 0006 start at zero
+            trips = trips.filter(day_count=0, stop_count=0)
+
+        fields = ['day_count', 'total_miles', 'stop_count']
+        batch = []
+        updated = 0
+        for trip in trips.only('id', 'daily_logs', 'rest_stops', 'route_data').iterator(
+                chunk_size=options['batch_size']):
+            trip.summarize()
+            batch.append(trip)
+            if len(batch) >= options['batch_size']:
+                updated += Trip.objects.bulk_update(batch, fields)
+                batch = []
+        if batch:
+            updated += Trip.objects.bulk_update(batch, fields)
+
+        self.stdout.write(self.style.SUCCESS(f'Summarized {updated} trips'))
@@ -0,0 +1,80 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tripwise.models import Trip
+from tripwise.trip_schema import json_depth, validate_saved_trip
+
+
+class Command(BaseCommand):
+    help = 'Validates stored trips against the SavedTrip schema used by the save endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--benchmark', action='store_true',
+                            help='Report validation time per trip')
+        parser.add_argument('--repeat', type=int, default=100,
+                            help='Validation passes over the stored trips when benchmarking')
+
+    def handle(self, *args, **options):
+        payloads = [
+            {
+                'id': str(trip.id),
+                'userId': trip.user_id,
+                'createdAt': trip.created_at.isoformat(),
+                'tripDetails': trip.trip_details,
+                'routeData': trip.route_data,
+                'restStops': trip.rest_stops,
+                'dailyLogs': trip.daily_logs,
+                'notes': trip.notes,
+            }
+            for trip in Trip.objects.order_by('id').iterator()
+        ]
+
+        invalid = 0
+        for payload in payloads:
+            errors = validate_saved_trip(payload)
+            if errors:
+                invalid += 1
+                first = errors[0]
+                self.stdout.write(self.style.WARNING(
+                    f"Trip {payload['id']}: {first['path']}: {first['message']} ({len(errors)} errors)"
+                ))
+        self.stdout.write(f'{len(payloads) - invalid} of {len(payloads)} stored trips are valid')
+
+        if options['benchmark'] and payloads:
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                for payload in payloads:
+                    validate_saved_trip(payload)
+            elapsed = time.perf_counter() - started
+            per_trip = elapsed / (options['repeat'] * len(payloads))
+            self.stdout.write(f'Validation: {per_trip * 1e6:,.1f} us per trip')
+            self._benchmark_depth_check(payloads, options['repeat'])
+
+    def _benchmark_depth_check(self, payloads, repeat):
+        """Compare the parser's nesting pre-check with json.loads, per trip and at the body limit"""
+        bodies = [json.dumps(payload, default=str).encode() for payload in payloads]
+        # Repeat the first stored day until the body is just under the size limit
+        padded = dict(payloads[0])
+        logs = padded['dailyLogs'] if isinstance(padded['dailyLogs'], list) else []
+        if logs:
+            room = settings.TRIP_MAX_BODY_BYTES - len(json.dumps(padded, default=str))
+            day_bytes = len(json.dumps(logs[0], default=str)) + 2
+            padded['dailyLogs'] = logs + logs[:1] * (room // day_bytes)
+        limit_body = json.dumps(padded, default=str).encode()
+
+        for label, samples, passes in (('stored trips', bodies, repeat),
+                                       (f'{len(limit_body):,} byte body', [limit_body], 5)):
+            timings = {}
+            for name, function in (('depth check', json_depth), ('json.loads', json.loads)):
+                started = time.perf_counter()
+                for _ in range(passes):
+                    for body in samples:
+                        function(body)
+                timings[name] = (time.perf_counter() - started) / (passes * len(samples))
+            self.stdout.write(
+                f"Depth check ({label}): {timings['depth check'] * 1e6:,.1f} us, "
+                f"json.loads {timings['json.loads'] * 1e6:,.1f} us"
+            )
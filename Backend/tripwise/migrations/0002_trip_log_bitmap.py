@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-19 02:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tripwise', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='log_bitmap',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='log_side_table',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-19 02:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tripwise', '0002_trip_log_bitmap'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=255)),
+                ('key', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('response', models.JSONField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user_id', 'key'), name='tripwise_idempotency_user_key_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-19 02:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tripwise', '0003_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTrip',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('user_id', models.CharField(db_index=True, max_length=255)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('codec', models.CharField(max_length=10)),
+                ('payload', models.BinaryField()),
+            ],
+        ),
+    ]
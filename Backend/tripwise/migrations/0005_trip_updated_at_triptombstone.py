@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-19 02:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tripwise', '0004_archivedtrip'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trip_id', models.BigIntegerField()),
+                ('user_id', models.CharField(max_length=255)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['user_id', 'updated_at'], name='tripwise_trip_user_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='triptombstone',
+            index=models.Index(fields=['user_id', 'deleted_at'], name='tripwise_tombstone_user_del'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-19 02:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tripwise', '0005_trip_updated_at_triptombstone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='day_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='stop_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='total_miles',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='trip',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
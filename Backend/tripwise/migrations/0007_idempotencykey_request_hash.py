@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 03:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tripwise', '0006_trip_summary_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='request_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
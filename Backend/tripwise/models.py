@@ -1,6 +1,13 @@
+import heapq
+
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from .archive import compress_payload, decompress_payload
+from .hos_audit import expand_days
+from .log_encoding import bitmap_days, encode_daily_logs
+from .trip_summary import summarize_trip
+
 # Create your models here.
 
 class Driver(AbstractUser):
@@ -13,12 +20,151 @@ class Driver(AbstractUser):
 
 class Trip(models.Model):
     user_id = models.CharField(max_length=255)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
     daily_logs = models.JSONField()
     notes = models.TextField(null=True, blank=True)
     rest_stops = models.JSONField()
     route_data = models.JSONField()
     trip_details = models.JSONField()
+    # Compact copy of daily_logs: packed 2-bit minute statuses plus a side table
+    log_bitmap = models.BinaryField(null=True, blank=True)
+    log_side_table = models.JSONField(null=True, blank=True)
+    # Summaries of the JSON columns, so listings never have to load them
+    day_count = models.PositiveIntegerField(default=0)
+    total_miles = models.FloatField(default=0)
+    stop_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Serves the per-driver changes feed
+            models.Index(fields=['user_id', 'updated_at'], name='tripwise_trip_user_updated'),
+        ]
 
     def __str__(self):
         return f"Trip {self.id} by User {self.user_id}"
+
+    def encode_logs(self):
+        """Refresh the compact encoding from daily_logs"""
+        if isinstance(self.daily_logs, list):
+            self.log_bitmap, self.log_side_table = encode_daily_logs(self.daily_logs)
+        else:
+            self.log_bitmap, self.log_side_table = None, None
+
+    def summarize(self):
+        """Refresh the summary columns from the JSON columns"""
+        self.day_count, self.total_miles, self.stop_count = summarize_trip(
+            self.daily_logs, self.rest_stops, self.route_data
+        )
+
+    def save(self, *args, **kwargs):
+        self.encode_logs()
+        self.summarize()
+        super().save(*args, **kwargs)
+
+
+class TripTombstone(models.Model):
+    """Record of a deleted trip, so sync clients can drop their copy"""
+    trip_id = models.BigIntegerField()
+    user_id = models.CharField(max_length=255)
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_id', 'deleted_at'], name='tripwise_tombstone_user_del'),
+        ]
+
+    def __str__(self):
+        return f"Deleted trip {self.trip_id} by User {self.user_id}"
+
+
+class IdempotencyKey(models.Model):
+    """Stored response of a trip save, replayed when the client retries"""
+    user_id = models.CharField(max_length=255)
+    key = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # SHA-256 of the request body, so a reused key with a different body is refused
+    request_hash = models.CharField(max_length=64, blank=True, default='')
+    status_code = models.PositiveSmallIntegerField()
+    response = models.JSONField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_id', 'key'], name='tripwise_idempotency_user_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Idempotency key {self.key} for User {self.user_id}"
+
+
+class ArchivedTrip(models.Model):
+    """Cold copy of an old Trip, with all JSON columns in one compressed blob"""
+    id = models.BigIntegerField(primary_key=True)  # Same id the trip had while hot
+    user_id = models.CharField(max_length=255, db_index=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    codec = models.CharField(max_length=10)
+    payload = models.BinaryField()
+
+    ARCHIVED_FIELDS = ('daily_logs', 'notes', 'rest_stops', 'route_data', 'trip_details')
+
+    def __str__(self):
+        return f"Archived trip {self.id} by User {self.user_id}"
+
+    @classmethod
+    def from_trip(cls, trip, codec):
+        payload = {field: getattr(trip, field) for field in cls.ARCHIVED_FIELDS}
+        return cls(
+            id=trip.id,
+            user_id=trip.user_id,
+            created_at=trip.created_at,
+            codec=codec,
+            payload=compress_payload(payload, codec),
+        )
+
+    def to_trip(self):
+        """Rebuild an unsaved Trip with the archived data"""
+        payload = decompress_payload(bytes(self.payload), self.codec)
+        return Trip(id=self.id, user_id=self.user_id, created_at=self.created_at, **payload)
+
+
+def audit_rows(user_id=None):
+    """Yield ``(user_id, trip_details, days)`` for hot and archived trips.
+
+    ``days`` holds the ``(date, minutes)`` pairs the HOS audit works on. Hot
+    trips are read from their minute bitmap, so daily_logs JSON is only parsed
+    for trips that have not been encoded yet and for archived trips. Rows come
+    in creation order across both tables, as ``hos_audit.load_histories``
+    expects, and are streamed so a fleet-wide audit never holds every trip at
+    once.
+    """
+    trips = Trip.objects.order_by('created_at', 'id')
+    archived = ArchivedTrip.objects.order_by('created_at', 'id')
+    if user_id is not None:
+        trips = trips.filter(user_id=user_id)
+        archived = archived.filter(user_id=user_id)
+
+    encoded_rows = (
+        ((created_at, trip_id), (trip_user_id, trip_details, bitmap_days(bytes(bitmap), side_table)))
+        for created_at, trip_id, trip_user_id, trip_details, bitmap, side_table
+        in trips.filter(log_bitmap__isnull=False).values_list(
+            'created_at', 'id', 'user_id', 'trip_details', 'log_bitmap', 'log_side_table'
+        ).iterator()
+    )
+    unencoded_rows = (
+        ((created_at, trip_id), (trip_user_id, trip_details, _logs_days(daily_logs)))
+        for created_at, trip_id, trip_user_id, trip_details, daily_logs
+        in trips.filter(log_bitmap__isnull=True).values_list(
+            'created_at', 'id', 'user_id', 'trip_details', 'daily_logs'
+        ).iterator()
+    )
+    archived_rows = (
+        ((trip.created_at, trip.id), (trip.user_id, trip.trip_details, _logs_days(trip.daily_logs)))
+        for trip in (row.to_trip() for row in archived.iterator())
+    )
+    for _, row in heapq.merge(encoded_rows, unencoded_rows, archived_rows, key=lambda item: item[0]):
+        yield row
+
+
+def _logs_days(daily_logs):
+    return list(expand_days(daily_logs)) if isinstance(daily_logs, list) else []
@@ -0,0 +1,41 @@
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.parsers import JSONParser
+
+from .trip_schema import loads_limited
+
+
+class RequestTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Request body is too large.'
+    default_code = 'request_too_large'
+
+
+class TripJSONParser(JSONParser):
+    """JSON parser that enforces size and nesting limits before parsing"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        max_bytes = settings.TRIP_MAX_BODY_BYTES
+        request = (parser_context or {}).get('request')
+
+        # Reject on the declared length without reading anything
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0) if request is not None else 0
+        except ValueError:
+            content_length = 0
+        if content_length > max_bytes:
+            raise RequestTooLarge()
+
+        # Guard against missing or wrong lengths by never reading past the limit
+        body = stream.read(max_bytes + 1) if stream is not None else b''
+        if len(body) > max_bytes:
+            raise RequestTooLarge()
+
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            if encoding.lower() not in ('utf-8', 'utf8'):
+                body = body.decode(encoding).encode('utf-8')
+            return loads_limited(body, settings.TRIP_MAX_JSON_DEPTH)
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
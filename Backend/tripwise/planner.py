@@ -0,0 +1,326 @@
+"""
+Multi-stop load planner.
+
+Orders many pickups and dropoffs (each dropoff after its pickup) with a greedy
+nearest-neighbour construction followed by relocate / 2-opt local search over
+a cached pairwise distance matrix, then lays the ordered legs out as the same
+segments and rest stops the frontend already renders for single-load trips.
+
+Distances are great-circle miles scaled by a road circuity factor, since the
+backend has no routing service of its own; stops must therefore carry the
+coordinates the client already geocodes.
+"""
+import datetime
+import hashlib
+
+import numpy as np
+from django.core.cache import cache
+
+from .hos_audit import (
+    MAX_DRIVING_BEFORE_BREAK, MAX_DRIVING_MINUTES, MAX_WINDOW_MINUTES, MIN_OFF_DUTY_MINUTES,
+    REQUIRED_BREAK_MINUTES,
+)
+
+EARTH_RADIUS_MILES = 3958.8
+ROAD_CIRCUITY_FACTOR = 1.2
+AVERAGE_SPEED = 65  # mph, matches HOS_CONSTANTS.AVERAGE_SPEED on the frontend
+MATRIX_CACHE_TIMEOUT = 60 * 60 * 24
+MAX_STOPS = 50
+
+# Stop durations in minutes / miles; the HOS limits come from the audit engine
+PICKUP_DROPOFF_MINUTES = 60
+FUEL_STOP_FREQUENCY = 1000
+FUEL_STOP_MINUTES = 30
+
+CYCLE_HOUR_LIMITS = {
+    '60-hour/7-day': 60,
+    '70-hour/8-day': 70,
+}
+
+
+class PlanningError(ValueError):
+    """Raised when a planning request cannot be satisfied"""
+
+
+def _coordinates(point, name):
+    try:
+        lat = float(point['lat'])
+        lon = float(point['lon'])
+    except (KeyError, TypeError, ValueError):
+        raise PlanningError(f'{name} must have numeric lat and lon')
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise PlanningError(f'{name} has out of range coordinates')
+    return lat, lon
+
+
+def distance_matrix(points):
+    """Pairwise road-distance estimates in miles for a list of (lat, lon) tuples.
+
+    The matrix is cached by the rounded coordinate list, so replanning the same
+    stops (for example after editing a remark or the departure time) skips the
+    computation.
+    """
+    rounded = [(round(lat, 5), round(lon, 5)) for lat, lon in points]
+    key = 'planner:matrix:' + hashlib.sha1(repr(rounded).encode()).hexdigest()
+    matrix = cache.get(key)
+    if matrix is not None:
+        return matrix
+
+    coords = np.radians(np.array(rounded, dtype=np.float64).reshape(-1, 2))
+    lat = coords[:, 0][:, None]
+    lon = coords[:, 1][:, None]
+    a = (
+        np.sin((lat - lat.T) / 2) ** 2
+        + np.cos(lat) * np.cos(lat.T) * np.sin((lon - lon.T) / 2) ** 2
+    )
+    matrix = 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0, 1))) * ROAD_CIRCUITY_FACTOR
+    cache.set(key, matrix, MATRIX_CACHE_TIMEOUT)
+    return matrix
+
+
+def _route_length(order, matrix):
+    path = [0] + order
+    return float(matrix[path[:-1], path[1:]].sum())
+
+
+def _is_feasible(order, required_before):
+    position = {node: index for index, node in enumerate(order)}
+    return all(position[before] < position[node] for node, before in required_before.items())
+
+
+def _construct(nodes, matrix, required_before):
+    """Greedy nearest neighbour that only picks stops whose pickup is done."""
+    order = []
+    remaining = set(nodes)
+    visited = set()
+    current = 0
+    while remaining:
+        ready = [node for node in remaining if node not in required_before or required_before[node] in visited]
+        if not ready:
+            raise PlanningError('Pickup and dropoff constraints form a cycle')
+        current = min(ready, key=lambda node: matrix[current, node])
+        order.append(current)
+        visited.add(current)
+        remaining.discard(current)
+    return order
+
+
+def _improve(order, matrix, required_before, max_passes=50):
+    """Relocate and 2-opt moves until no feasible move shortens the route."""
+    best = _route_length(order, matrix)
+    size = len(order)
+    for _ in range(max_passes):
+        improved = False
+
+        # Relocate: move one stop to another position
+        for source in range(size):
+            for target in range(size):
+                if source == target:
+                    continue
+                candidate = order[:source] + order[source + 1:]
+                candidate.insert(target, order[source])
+                length = _route_length(candidate, matrix)
+                if length < best - 1e-9 and _is_feasible(candidate, required_before):
+                    order, best, improved = candidate, length, True
+
+        # 2-opt: reverse a run of stops
+        for start in range(size - 1):
+            for end in range(start + 2, size + 1):
+                candidate = order[:start] + order[start:end][::-1] + order[end:]
+                length = _route_length(candidate, matrix)
+                if length < best - 1e-9 and _is_feasible(candidate, required_before):
+                    order, best, improved = candidate, length, True
+
+        if not improved:
+            break
+    return order
+
+
+def _parse_request(data):
+    if not isinstance(data, dict):
+        raise PlanningError('Request body must be an object')
+    start = data.get('start')
+    stops = data.get('stops')
+    if not isinstance(start, dict):
+        raise PlanningError('start is required')
+    if not isinstance(stops, list) or not stops:
+        raise PlanningError('stops must be a non-empty list')
+    if len(stops) > MAX_STOPS:
+        raise PlanningError(f'At most {MAX_STOPS} stops can be planned at once')
+
+    points = [_coordinates(start, 'start')]
+    for index, stop in enumerate(stops, start=1):
+        if not isinstance(stop, dict):
+            raise PlanningError(f'Stop {index} must be an object')
+        points.append(_coordinates(stop, f'Stop {index}'))
+
+    # Positional default ids could collide with explicit ones that pickupId refers to
+    uses_pickup_ids = any('pickupId' in stop for stop in stops)
+    ids = {}
+    for index, stop in enumerate(stops, start=1):
+        if uses_pickup_ids and stop.get('id') is None:
+            raise PlanningError(f'Stop {index} needs an id when stops use pickupId')
+        stop_id = str(stop.get('id', index))
+        if stop_id in ids:
+            raise PlanningError(f'Duplicate stop id {stop_id}')
+        ids[stop_id] = index
+
+    # Dropoffs name the pickup they depend on
+    required_before = {}
+    for index, stop in enumerate(stops, start=1):
+        pickup = stop.get('pickupId')
+        if pickup is None:
+            continue
+        if str(pickup) not in ids:
+            raise PlanningError(f'Stop {index} references unknown pickup {pickup}')
+        required_before[index] = ids[str(pickup)]
+
+    return start, stops, points, required_before
+
+
+def _format_time(departure, minutes):
+    return (departure + datetime.timedelta(minutes=minutes)).isoformat()
+
+
+def _format_duration(minutes):
+    hours, mins = divmod(int(round(minutes)), 60)
+    if hours == 0:
+        return f'{mins} min'
+    if mins == 0:
+        return f'{hours} h'
+    return f'{hours} h {mins} min'
+
+
+def _schedule(legs, departure):
+    """Drive the ordered legs, inserting the breaks, rests and fuel stops HOS requires."""
+    rest_stops = []
+    daily_miles = [0.0]
+    clock = 0.0
+    shift_start = 0.0
+    driven_in_shift = 0.0
+    driven_since_break = 0.0
+    miles_since_fuel = 0.0
+
+    def stop(location, stop_type, minutes, reason):
+        nonlocal clock
+        rest_stops.append({
+            'location': location,
+            'type': stop_type,
+            'duration': _format_duration(minutes),
+            'arrivalTime': _format_time(departure, clock),
+            'departureTime': _format_time(departure, clock + minutes),
+            'stopReason': reason,
+        })
+        clock += minutes
+
+    for leg in legs:
+        remaining = leg['estimatedDrivingTime']
+        miles_per_minute = leg['distance'] / remaining if remaining else 0.0
+        en_route = f"En route from {leg['startLocation']} to {leg['endLocation']}"
+        while remaining > 1e-9:
+            until_fuel = (
+                (FUEL_STOP_FREQUENCY - miles_since_fuel) / miles_per_minute if miles_per_minute else remaining
+            )
+            chunk = min(
+                remaining,
+                MAX_DRIVING_BEFORE_BREAK - driven_since_break,
+                MAX_DRIVING_MINUTES - driven_in_shift,
+                MAX_WINDOW_MINUTES - (clock - shift_start),
+                until_fuel,
+            )
+            chunk = max(chunk, 0.0)
+            clock += chunk
+            remaining -= chunk
+            driven_in_shift += chunk
+            driven_since_break += chunk
+            miles_since_fuel += chunk * miles_per_minute
+            daily_miles[-1] += chunk * miles_per_minute
+            if remaining <= 1e-9:
+                break
+
+            if (driven_in_shift >= MAX_DRIVING_MINUTES - 1e-9
+                    or clock - shift_start >= MAX_WINDOW_MINUTES - 1e-9):
+                stop(en_route, 'rest', MIN_OFF_DUTY_MINUTES,
+                     'Required 10-hour rest period after reaching the 11/14-hour limit')
+                shift_start = clock
+                driven_in_shift = 0.0
+                daily_miles.append(0.0)
+            elif miles_since_fuel >= FUEL_STOP_FREQUENCY - 1e-6:
+                stop(en_route, 'fuel', FUEL_STOP_MINUTES, 'Fuel stop')
+                miles_since_fuel = 0.0
+            else:
+                stop(en_route, 'food', REQUIRED_BREAK_MINUTES,
+                     'Mandatory 30-minute break after 8 hours driving')
+            driven_since_break = 0.0
+
+        # Loading or unloading counts as a 30-minute interruption of driving
+        clock += PICKUP_DROPOFF_MINUTES
+        driven_since_break = 0.0
+
+    return rest_stops, [round(miles, 1) for miles in daily_miles]
+
+
+def plan_trip(data):
+    """Plan a multi-stop trip and return it in the GeminiRouteData shape.
+
+    ``data`` holds a ``start`` point and a list of ``stops``; every point has
+    ``lat``, ``lon`` and a ``location`` label, stops may have an ``id`` and
+    dropoffs name their pickup with ``pickupId``, in which case every stop
+    needs an ``id``.
+    """
+    start, stops, points, required_before = _parse_request(data)
+    matrix = distance_matrix(points)
+
+    nodes = list(range(1, len(points)))
+    order = _construct(nodes, matrix, required_before)
+    order = _improve(order, matrix, required_before)
+
+    labels = [start.get('location') or 'Start'] + [
+        stop.get('location') or f'Stop {index}' for index, stop in enumerate(stops, start=1)
+    ]
+    segments = []
+    for origin, destination in zip([0] + order[:-1], order):
+        distance = float(matrix[origin, destination])
+        segments.append({
+            'startLocation': labels[origin],
+            'endLocation': labels[destination],
+            'distance': round(distance, 1),
+            'estimatedDrivingTime': round(distance / AVERAGE_SPEED * 60),
+        })
+
+    departure = data.get('departureTime')
+    try:
+        departure = datetime.datetime.fromisoformat(departure) if departure else None
+    except (TypeError, ValueError):
+        raise PlanningError('departureTime must be an ISO 8601 timestamp')
+    departure = departure or datetime.datetime.now(datetime.timezone.utc).replace(second=0, microsecond=0)
+
+    rest_stops, daily_miles = _schedule(segments, departure)
+    total_distance = round(sum(segment['distance'] for segment in segments), 1)
+    total_driving_time = sum(segment['estimatedDrivingTime'] for segment in segments)
+
+    violations = []
+    try:
+        available_hours = float(data.get('availableDrivingHours', ''))
+    except (TypeError, ValueError):
+        available_hours = None
+    cycle_limit = CYCLE_HOUR_LIMITS.get(data.get('currentCycle'))
+    driving_hours = total_driving_time / 60
+    if available_hours is not None and driving_hours > available_hours:
+        violations.append(
+            f'Trip requires {driving_hours:.1f} hours of driving, but only {available_hours:g} hours available.'
+        )
+    if cycle_limit and driving_hours > cycle_limit:
+        violations.append(f"Trip exceeds {data['currentCycle']} cycle limit.")
+
+    return {
+        'stopOrder': [str(stops[node - 1].get('id', node)) for node in order],
+        'segments': segments,
+        'restStops': rest_stops,
+        'totalDistance': total_distance,
+        'totalDrivingTime': total_driving_time,
+        'hosCompliant': not violations,
+        'violations': violations,
+        'multiDayTrip': len(daily_miles) > 1,
+        'dailyMiles': daily_miles,
+    }
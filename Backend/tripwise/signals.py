@@ -0,0 +1,32 @@
+import contextvars
+from contextlib import contextmanager
+
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import ArchivedTrip, Trip, TripTombstone
+
+_archiving = contextvars.ContextVar('tripwise_archiving', default=False)
+
+
+@contextmanager
+def archiving():
+    """Delete trips without leaving tombstones; the caller has moved them to the archive"""
+    token = _archiving.set(True)
+    try:
+        yield
+    finally:
+        _archiving.reset(token)
+
+
+@receiver(post_delete, sender=Trip)
+def record_trip_tombstone(sender, instance, **kwargs):
+    """Leave a tombstone for the changes feed, unless the trip was only archived"""
+    if _archiving.get():
+        return
+    TripTombstone.objects.create(trip_id=instance.id, user_id=instance.user_id)
+
+
+@receiver(post_delete, sender=ArchivedTrip)
+def record_archived_trip_tombstone(sender, instance, **kwargs):
+    TripTombstone.objects.create(trip_id=instance.id, user_id=instance.user_id)
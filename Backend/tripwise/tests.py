@@ -1,3 +1,762 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from core import routers
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .hos_audit import (
+    RULE_BREAK_30, RULE_CYCLE, RULE_DRIVING_11, RULE_OFF_DUTY_10, RULE_WINDOW_14,
+    audit_driver, expand_daily_log, DRIVING, OFF_DUTY, ON_DUTY, SLEEPER,
+)
+from .log_encoding import BYTES_PER_DAY, day_totals, decode_daily_logs, encode_daily_logs
+from .models import ArchivedTrip, Driver, IdempotencyKey, Trip
+from .planner import PlanningError, plan_trip
+from .sync import decode_token
+from .throttling import TokenBucketThrottle, parse_rate
+from .trip_schema import json_depth, validate_saved_trip
+
+
+def make_day(date, *entries):
+    return {
+        'date': date,
+        'startLocation': 'A',
+        'endLocation': 'B',
+        'totalMiles': 0,
+        'logs': [
+            {'startTime': start, 'endTime': end, 'status': status, 'location': 'A'}
+            for start, end, status in entries
+        ],
+    }
+
+
+def make_trip_payload(trip_id='trip-1-abc'):
+    return {
+        'id': trip_id,
+        'userId': '7',
+        'createdAt': '2023-06-15T06:00:00Z',
+        'tripDetails': {
+            'currentLocation': 'Atlanta, GA',
+            'pickupLocation': 'Chattanooga, TN',
+            'dropoffLocation': 'Louisville, KY',
+            'currentCycle': '70-hour/8-day',
+            'availableDrivingHours': '11',
+        },
+        'routeData': {
+            'segments': [{'startLocation': 'Atlanta, GA', 'endLocation': 'Chattanooga, TN',
+                          'distance': 118, 'estimatedDrivingTime': 109}],
+            'restStops': [],
+            'totalDistance': 118,
+            'totalDrivingTime': 109,
+            'hosCompliant': True,
+            'violations': [],
+            'multiDayTrip': False,
+            'dailyMiles': [118],
+        },
+        'restStops': [{'location': 'Chattanooga, TN', 'type': 'fuel', 'duration': '30 min',
+                       'arrivalTime': '12:15 PM', 'departureTime': '12:45 PM', 'stopReason': 'Fuel stop'}],
+        'dailyLogs': [make_day('2023-06-15', ('00:00', '06:00', 'off-duty'), ('06:00', '08:00', 'driving'),
+                               ('08:00', '24:00', 'off-duty'))],
+    }
+
+
+def rules(report):
+    return {violation['rule'] for violation in report['violations']}
+
+
+class HOSAuditTests(TestCase):
+    def test_expand_daily_log(self):
+        day = expand_daily_log(make_day(
+            '2023-06-15',
+            ('00:00', '06:00', 'sleeper'),
+            ('06:00', '06:15', 'on-duty'),
+            ('06:15', '10:00', 'driving'),
+            ('10:00', '24:00', 'off-duty'),
+        ))
+        self.assertEqual(day.size, 1440)
+        self.assertEqual(day[0], SLEEPER)
+        self.assertEqual(day[6 * 60], ON_DUTY)
+        self.assertEqual(day[6 * 60 + 15], DRIVING)
+        self.assertEqual(day[1439], OFF_DUTY)
+
+    def test_compliant_day(self):
+        report = audit_driver([make_day(
+            '2023-06-15',
+            ('00:00', '06:00', 'off-duty'),
+            ('06:00', '10:00', 'driving'),
+            ('10:00', '10:30', 'off-duty'),
+            ('10:30', '16:00', 'driving'),
+            ('16:00', '24:00', 'off-duty'),
+        )])
+        self.assertTrue(report['compliant'])
+        self.assertEqual(report['days'], 1)
+
+    def test_driving_break_and_window_violations(self):
+        report = audit_driver([make_day(
+            '2023-06-15',
+            ('00:00', '05:00', 'off-duty'),
+            ('05:00', '08:00', 'on-duty'),
+            ('08:00', '20:00', 'driving'),
+            ('20:00', '24:00', 'off-duty'),
+        )])
+        self.assertEqual(rules(report), {RULE_DRIVING_11, RULE_WINDOW_14, RULE_BREAK_30})
+        driving_11 = [v for v in report['violations'] if v['rule'] == RULE_DRIVING_11]
+        self.assertEqual(driving_11, [
+            {'rule': RULE_DRIVING_11, 'date': '2023-06-15', 'start': '19:00', 'minutes': 60},
+        ])
+
+    def test_short_overnight_rest(self):
+        report = audit_driver([
+            make_day('2023-06-15', ('00:00', '16:00', 'off-duty'), ('16:00', '17:00', 'on-duty'),
+                     ('17:00', '24:00', 'sleeper')),
+            make_day('2023-06-16', ('00:00', '01:00', 'sleeper'), ('01:00', '03:00', 'driving'),
+                     ('03:00', '24:00', 'off-duty')),
+        ])
+        self.assertEqual(report['violations'], [
+            {'rule': RULE_OFF_DUTY_10, 'date': '2023-06-16', 'start': '01:00', 'minutes': 120},
+        ])
+
+    def test_short_daytime_rest(self):
+        report = audit_driver([make_day(
+            '2023-06-15',
+            ('00:00', '06:00', 'off-duty'),
+            ('06:00', '07:00', 'driving'),
+            ('07:00', '15:00', 'off-duty'),
+            ('15:00', '16:00', 'driving'),
+            ('16:00', '24:00', 'off-duty'),
+        )])
+        self.assertEqual(rules(report), {RULE_OFF_DUTY_10})
+
+    def test_short_rest_followed_by_on_duty_only(self):
+        report = audit_driver([
+            make_day('2023-06-15', ('00:00', '14:00', 'off-duty'), ('14:00', '22:00', 'on-duty'),
+                     ('22:00', '24:00', 'sleeper')),
+            make_day('2023-06-16', ('00:00', '06:00', 'sleeper'), ('06:00', '08:00', 'on-duty'),
+                     ('08:00', '24:00', 'off-duty')),
+        ])
+        self.assertTrue(report['compliant'])
+
+    def test_cycle_limit(self):
+        days = [
+            make_day(f'2023-06-{day:02d}', ('00:00', '06:00', 'off-duty'), ('06:00', '08:00', 'on-duty'),
+                     ('08:00', '14:00', 'driving'), ('14:00', '14:30', 'off-duty'),
+                     ('14:30', '18:00', 'driving'), ('18:00', '24:00', 'off-duty'))
+            for day in range(1, 9)
+        ]
+        self.assertEqual(rules(audit_driver(days, '70-hour/8-day')), {RULE_CYCLE})
+        self.assertTrue(audit_driver(days[:6], '70-hour/8-day')['compliant'])
+
+    def test_user_audit_endpoint(self):
+        Trip.objects.create(
+            user_id='7',
+            daily_logs=[make_day('2023-06-15', ('00:00', '08:00', 'off-duty'), ('08:00', '20:00', 'driving'))],
+            rest_stops=[],
+            route_data={},
+            trip_details={'currentCycle': '70-hour/8-day'},
+        )
+        response = self.client.get('/api/trip/user/7/audit/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['compliant'])
+        self.assertIn(RULE_DRIVING_11, rules(response.json()))
+
+    def test_audit_reads_the_minute_bitmap(self):
+        logs = [make_day('2023-06-15', ('00:00', '08:00', 'off-duty'), ('08:00', '20:00', 'driving'))]
+        encoded = Trip.objects.create(user_id='7', daily_logs=logs, rest_stops=[], route_data={},
+                                      trip_details={})
+        # The JSON column is not consulted once a trip is encoded
+        Trip.objects.filter(id=encoded.id).update(daily_logs=[])
+        report = self.client.get('/api/trip/user/7/audit/').json()
+        self.assertIn(RULE_DRIVING_11, rules(report))
+        self.assertEqual(report['status_minutes']['driving'], 720)
+
+        # Trips not encoded yet fall back to parsing daily_logs
+        Trip.objects.filter(id=encoded.id).update(daily_logs=logs, log_bitmap=None, log_side_table=None)
+        self.assertEqual(self.client.get('/api/trip/user/7/audit/').json(), report)
+
+    def test_fleet_audit_workers(self):
+        admin = Driver.objects.create_superuser(username='admin', email='admin@example.com', password='pw')
+        self.client.force_login(admin)
+        for workers in ('0', '-2'):
+            response = self.client.get('/api/audit/', {'workers': workers})
+            self.assertEqual(response.status_code, 400)
+        with mock.patch('tripwise.views.audit_fleet', return_value={}) as audit, \
+                mock.patch('tripwise.views.os.cpu_count', return_value=2):
+            self.assertEqual(self.client.get('/api/audit/', {'workers': '1000'}).status_code, 200)
+        self.assertEqual(audit.call_args.kwargs['workers'], 2)
+
+
+class LogEncodingTests(TestCase):
+    def setUp(self):
+        self.daily_logs = [
+            make_day('2023-06-15', ('00:00', '05:45', 'off-duty'), ('05:45', '06:00', 'on-duty'),
+                     ('06:00', '08:45', 'driving'), ('08:45', '09:15', 'on-duty'),
+                     ('09:15', '19:45', 'driving'), ('19:45', '24:00', 'sleeper')),
+            make_day('2023-06-16', ('00:00', '05:45', 'sleeper'), ('05:45', '10:30', 'on-duty'),
+                     ('10:30', '24:00', 'off-duty')),
+        ]
+        self.daily_logs[0]['logs'][1]['remarks'] = 'Pre-trip inspection'
+
+    def test_round_trip(self):
+        bitmap, side_table = encode_daily_logs(self.daily_logs)
+        self.assertEqual(len(bitmap), 2 * BYTES_PER_DAY)
+        self.assertEqual(decode_daily_logs(bitmap, side_table), self.daily_logs)
+
+    def test_round_trip_overlapping_and_empty_entries(self):
+        daily_logs = [make_day('2023-06-15', ('00:00', '12:00', 'off-duty'), ('10:00', '11:00', 'driving'),
+                               ('12:00', '12:00', 'on-duty'), ('12:00', '24:00', 'sleeper'))]
+        bitmap, side_table = encode_daily_logs(daily_logs)
+        self.assertEqual(decode_daily_logs(bitmap, side_table), daily_logs)
+
+    def test_round_trip_keeps_entries_that_do_not_encode(self):
+        daily_logs = [
+            make_day('2023-06-15', ('00:00', '08:00', 'off-duty'), ('8:00', '09:00', 'driving'),
+                     ('09:00', '10:00', 'On Duty'), ('10:00', '24:00', 'off-duty')),
+            'not a day',
+            {'date': '2023-06-16', 'logs': None, 'shipper': 'ACME'},
+        ]
+        daily_logs[0]['logs'][0].update({'id': 'log-1', 'miles': 0, 'remarks': None})
+        daily_logs[0]['logs'].append(['not', 'an', 'entry'])
+        daily_logs[0]['logs'][-2].pop('location')
+        daily_logs[0]['logs'][-2]['location'] = None
+        daily_logs[0]['trailer'] = 'T-42'
+        bitmap, side_table = encode_daily_logs(daily_logs)
+        self.assertEqual(decode_daily_logs(bitmap, side_table), daily_logs)
+
+    def test_side_table_stores_each_location_once(self):
+        _, side_table = encode_daily_logs(self.daily_logs)
+        self.assertEqual(side_table['locations'], ['A'])
+        entry = side_table['days'][0]['entries'][0]
+        self.assertEqual(entry, [0, 345, 0])
+
+    def test_day_totals(self):
+        bitmap, _ = encode_daily_logs(self.daily_logs)
+        totals = day_totals(bitmap)
+        self.assertEqual(totals[0].tolist(), [345, 255, 795, 45])
+        self.assertEqual(totals[1].tolist(), [810, 345, 0, 285])
+
+    def test_trip_save_stores_encoding(self):
+        trip = Trip.objects.create(user_id='7', daily_logs=self.daily_logs, rest_stops=[],
+                                   route_data={}, trip_details={})
+        trip.refresh_from_db()
+        self.assertEqual(decode_daily_logs(bytes(trip.log_bitmap), trip.log_side_table), self.daily_logs)
+
+
+class MultiStopPlannerTests(TestCase):
+    def make_request(self, loads, seed=1):
+        rng = random.Random(seed)
+        stops = []
+        for load in range(loads):
+            for kind in ('P', 'D'):
+                stop = {
+                    'id': f'{kind}{load}',
+                    'location': f'{kind}{load}',
+                    'lat': 35 + rng.uniform(-3, 3),
+                    'lon': -90 + rng.uniform(-5, 5),
+                }
+                if kind == 'D':
+                    stop['pickupId'] = f'P{load}'
+                stops.append(stop)
+        return {
+            'start': {'location': 'Depot', 'lat': 35, 'lon': -90},
+            'stops': stops,
+            'departureTime': '2023-06-15T06:00:00+00:00',
+            'currentCycle': '70-hour/8-day',
+        }
+
+    def test_pickups_precede_dropoffs(self):
+        plan = plan_trip(self.make_request(10))
+        order = plan['stopOrder']
+        self.assertEqual(len(order), 20)
+        for load in range(10):
+            self.assertLess(order.index(f'P{load}'), order.index(f'D{load}'))
+        self.assertEqual(plan['segments'][0]['startLocation'], 'Depot')
+        self.assertEqual(len(plan['segments']), 20)
+
+    def test_inserts_hos_stops(self):
+        plan = plan_trip(self.make_request(10))
+        self.assertTrue(plan['multiDayTrip'])
+        self.assertIn('rest', {stop['type'] for stop in plan['restStops']})
+        self.assertAlmostEqual(sum(plan['dailyMiles']), plan['totalDistance'], delta=1)
+
+    def test_plan_trip_command(self):
+        out = io.StringIO()
+        call_command('plan_trip', loads=10, seed=2, benchmark=True, repeat=1, stdout=out)
+        self.assertIn('20 stops', out.getvalue())
+        self.assertIn('ms per plan', out.getvalue())
+
+    def test_rejects_unknown_pickup(self):
+        request = self.make_request(1)
+        request['stops'][1]['pickupId'] = 'missing'
+        with self.assertRaises(PlanningError):
+            plan_trip(request)
+
+    def test_pickup_ids_require_explicit_stop_ids(self):
+        request = self.make_request(2)
+        del request['stops'][0]['id']
+        with self.assertRaisesRegex(PlanningError, 'Stop 1 needs an id'):
+            plan_trip(request)
+
+    def test_plan_endpoint(self):
+        response = self.client.post('/api/trip/plan/', self.make_request(3), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['stopOrder']), 6)
+        response = self.client.post('/api/trip/plan/', {'stops': []}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class IdempotentTripSaveTests(TestCase):
+    def trip_payload(self, trip_id='trip-1-abc'):
+        return make_trip_payload(trip_id)
+
+    def test_replayed_save_returns_original_response(self):
+        first = self.client.post('/api/trip/save/', self.trip_payload(), content_type='application/json')
+        second = self.client.post('/api/trip/save/', self.trip_payload(), content_type='application/json')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Trip.objects.count(), 1)
+
+    def test_header_key_reused_with_different_body_is_rejected(self):
+        responses = [
+            self.client.post('/api/trip/save/', self.trip_payload(trip_id), content_type='application/json',
+                             HTTP_IDEMPOTENCY_KEY='same-key')
+            for trip_id in ('trip-1-abc', 'trip-2-def')
+        ]
+        self.assertEqual([response.status_code for response in responses], [201, 422])
+        self.assertEqual(Trip.objects.count(), 1)
+
+    def test_invalid_header_key_is_rejected(self):
+        for key in ('   ', 'k' * 256):
+            response = self.client.post('/api/trip/save/', self.trip_payload(), content_type='application/json',
+                                        HTTP_IDEMPOTENCY_KEY=key)
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Trip.objects.exists())
+
+    def test_expired_keys_are_purged_and_reusable(self):
+        self.client.post('/api/trip/save/', self.trip_payload(), content_type='application/json')
+        IdempotencyKey.objects.update(created_at=timezone.now() - datetime.timedelta(days=30))
+        call_command('purge_idempotency_keys', stdout=io.StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.client.post('/api/trip/save/', self.trip_payload(), content_type='application/json')
+        self.assertEqual(Trip.objects.count(), 2)
+
+
+class TripValidationTests(TestCase):
+    def test_valid_trip(self):
+        self.assertEqual(validate_saved_trip(make_trip_payload()), [])
+
+    def test_structured_errors(self):
+        payload = make_trip_payload()
+        del payload['userId']
+        payload['dailyLogs'][0]['logs'][1]['startTime'] = '25:00'
+        payload['restStops'][0]['type'] = 'nap'
+        paths = {error['path'] for error in validate_saved_trip(payload)}
+        self.assertEqual(paths, {'userId', 'dailyLogs[0].logs[1].startTime', 'restStops[0].type'})
+
+    def test_log_times_must_be_24_hour(self):
+        payload = make_trip_payload()
+        payload['dailyLogs'][0]['logs'][0]['startTime'] = '12:00 PM'
+        self.assertEqual([error['path'] for error in validate_saved_trip(payload)],
+                         ['dailyLogs[0].logs[0].startTime'])
+
+    def test_impossible_created_at_is_a_validation_error(self):
+        payload = make_trip_payload()
+        payload['createdAt'] = '2023-02-30T10:00:00'
+        self.assertEqual([error['path'] for error in validate_saved_trip(payload)], ['createdAt'])
+        response = self.client.post('/api/trip/save/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_json_depth_ignores_brackets_in_strings(self):
+        self.assertEqual(json_depth(b'{"a": [{"b": "[[[[{{"}]}'), 3)
+        self.assertEqual(json_depth(b'{"a": ["\\\\", "\\"[[", {"b": []}]}'), 4)
+
+    def test_json_depth_of_body_at_limit(self):
+        payload = make_trip_payload()
+        while len(json.dumps(payload)) < settings.TRIP_MAX_BODY_BYTES - 2000:
+            payload['dailyLogs'].append(payload['dailyLogs'][0])
+        body = json.dumps(payload).encode()
+        self.assertLessEqual(len(body), settings.TRIP_MAX_BODY_BYTES)
+        # object > dailyLogs list > day > logs list > entry
+        self.assertEqual(json_depth(body), 5)
+
+    def test_invalid_trip_rejected_without_saving(self):
+        payload = make_trip_payload()
+        payload['dailyLogs'] = 'not a list'
+        response = self.client.post('/api/trip/save/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['details'][0]['path'], 'dailyLogs')
+        self.assertFalse(Trip.objects.exists())
+
+    def test_oversized_and_deep_bodies_rejected(self):
+        with self.settings(TRIP_MAX_BODY_BYTES=1024):
+            payload = make_trip_payload()
+            payload['notes'] = 'x' * 2000
+            response = self.client.post('/api/trip/save/', payload, content_type='application/json')
+            self.assertEqual(response.status_code, 413)
+        response = self.client.post('/api/trip/save/', '[' * 100 + ']' * 100, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1', 'replica_2'])
+class PrimaryReplicaRouterTests(TestCase):
+    def setUp(self):
+        self.router = routers.PrimaryReplicaRouter()
+        routers._replica_health.clear()
+
+    def test_reads_use_healthy_replicas(self):
+        with mock.patch.object(routers, '_check_replica', side_effect=lambda alias: alias == 'replica_2'):
+            self.assertEqual(self.router.db_for_read(Trip), 'replica_2')
+        self.assertEqual(self.router.db_for_write(Trip), 'default')
+
+    def test_failover_to_primary(self):
+        with mock.patch.object(routers, '_check_replica', return_value=False) as check:
+            self.assertEqual(self.router.db_for_read(Trip), 'default')
+            self.assertEqual(self.router.db_for_read(Trip), 'default')
+        # Failed replicas are not re-checked until REPLICA_RETRY_SECONDS pass
+        self.assertEqual(check.call_count, 2)
+
+    def test_pinned_reads_use_primary(self):
+        with mock.patch.object(routers, '_check_replica', return_value=True):
+            with routers.use_primary():
+                self.assertEqual(self.router.db_for_read(Trip), 'default')
+            self.assertIn(self.router.db_for_read(Trip), ('replica_1', 'replica_2'))
+
+    def test_writes_pin_the_client(self):
+        response = self.client.post('/api/trip/save/', make_trip_payload(), content_type='application/json')
+        self.assertIn('tw_primary_until', response.cookies)
+        self.assertEqual(response.cookies['tw_primary_until']['samesite'], 'None')
+        self.assertTrue(response.cookies['tw_primary_until']['secure'])
+        with mock.patch.object(routers, '_check_replica', return_value=True):
+            self.assertTrue(self._pinned_during(self.client.get, '/api/trip/user/7/'))
+            self.client.cookies.clear()
+            self.assertFalse(self._pinned_during(self.client.get, '/api/trip/user/7/'))
+
+    def test_replica_failure_retries_on_primary(self):
+        pinned = []
+
+        def flaky_get(view, request, user_id):
+            pinned.append(routers.is_pinned())
+            if not routers.is_pinned():
+                replica = self.router.db_for_read(Trip)
+                raise OperationalError(f'{replica} went away')
+            return Response([])
+
+        with mock.patch.object(routers, '_check_replica', return_value=True), \
+                mock.patch('tripwise.views.UserTripsView.get', flaky_get):
+            response = self.client.get('/api/trip/user/7/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(pinned, [False, True])
+        self.assertEqual([healthy for _, healthy in routers._replica_health.values() if not healthy], [False])
+
+    def _pinned_during(self, method, path):
+        seen = []
+
+        def spy(router, model, **hints):
+            seen.append(routers.is_pinned())
+            return 'default'
+
+        with mock.patch.object(routers.PrimaryReplicaRouter, 'db_for_read', spy), \
+                override_settings(DATABASE_ROUTERS=['core.routers.PrimaryReplicaRouter']):
+            method(path)
+        return all(seen) and bool(seen)
+
+
+def unpinned_reads(function, *args, **kwargs):
+    """Models read through the replica router while not pinned to the primary."""
+    seen = []
+
+    def spy(router, model, **hints):
+        if not routers.is_pinned():
+            seen.append(model)
+        return 'default'
+
+    with mock.patch.object(routers.PrimaryReplicaRouter, 'db_for_read', spy), \
+            override_settings(DATABASE_ROUTERS=['core.routers.PrimaryReplicaRouter'],
+                              DATABASE_REPLICAS=['replica_1']):
+        function(*args, **kwargs)
+    return seen
+
+
+class TripArchiveTests(TestCase):
+    def setUp(self):
+        self.old = Trip.objects.create(user_id='7', daily_logs=make_trip_payload()['dailyLogs'], rest_stops=[],
+                                       route_data={'segments': []}, trip_details={}, notes='old')
+        Trip.objects.filter(id=self.old.id).update(created_at=timezone.now() - datetime.timedelta(days=400))
+        self.new = Trip.objects.create(user_id='7', daily_logs=[], rest_stops=[], route_data={},
+                                       trip_details={}, notes='new')
+
+    def test_archive_moves_old_trips(self):
+        call_command('archive_trips', stdout=io.StringIO())
+        self.assertEqual(list(Trip.objects.values_list('id', flat=True)), [self.new.id])
+        archived = ArchivedTrip.objects.get()
+        self.assertEqual(archived.id, self.old.id)
+        self.assertEqual(archived.to_trip().daily_logs, self.old.daily_logs)
+
+    def test_archive_reads_from_primary_with_replicas(self):
+        out = io.StringIO()
+        self.assertEqual(unpinned_reads(call_command, 'archive_trips', stdout=out), [])
+        self.assertIn('Hot table: 2 -> 1 trips', out.getvalue())
+
+    def test_read_endpoints_include_archived_trips(self):
+        call_command('archive_trips', stdout=io.StringIO())
+        response = self.client.get('/api/trip/user/7/')
+        self.assertEqual([trip['notes'] for trip in response.json()], ['old', 'new'])
+        response = self.client.get(f'/api/trip/{self.old.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['route_data'], {'segments': []})
+        self.assertEqual(self.client.get('/api/trip/999999/').status_code, 404)
+
+    def test_audit_includes_archived_trips(self):
+        Trip.objects.filter(id=self.old.id).update(daily_logs=[
+            make_day('2023-06-15', ('00:00', '08:00', 'off-duty'), ('08:00', '20:00', 'driving')),
+        ])
+        call_command('archive_trips', stdout=io.StringIO())
+        response = self.client.get('/api/trip/user/7/audit/')
+        self.assertEqual(response.json()['days'], 1)
+        self.assertIn(RULE_DRIVING_11, rules(response.json()))
+        out = io.StringIO()
+        call_command('audit_hos', user='7', workers=1, stdout=out)
+        self.assertIn('User 7: 1 days', out.getvalue())
+
+
+@override_settings(TRIP_SYNC_SAFETY_SECONDS=0, TRIP_SYNC_PAGE_SIZE=2)
+class TripChangesFeedTests(TestCase):
+    def create_trip(self, notes):
+        return Trip.objects.create(user_id='7', daily_logs=[], rest_stops=[], route_data={},
+                                   trip_details={}, notes=notes)
+
+    def changes(self, token=None):
+        path = '/api/trip/user/7/changes/' + (f'?since={token}' if token else '')
+        return self.client.get(path).json()
+
+    def test_full_sync_pages_through_trips(self):
+        for notes in ('a', 'b', 'c'):
+            self.create_trip(notes)
+        first = self.changes()
+        self.assertTrue(first['has_more'])
+        second = self.changes(first['sync_token'])
+        self.assertFalse(second['has_more'])
+        notes = [trip['notes'] for trip in first['changed'] + second['changed']]
+        self.assertEqual(notes, ['a', 'b', 'c'])
+
+    def test_incremental_sync_returns_only_changes(self):
+        kept = self.create_trip('kept')
+        removed = self.create_trip('removed')
+        token = self.changes()['sync_token']
+        self.assertEqual(self.changes(token)['changed'], [])
+
+        kept.notes = 'edited'
+        kept.save()
+        removed_id = removed.id
+        removed.delete()
+        added = self.create_trip('added')
+        feed = self.changes(token)
+        self.assertEqual({trip['id'] for trip in feed['changed']}, {kept.id, added.id})
+        self.assertEqual(feed['deleted'], [removed_id])
+
+    def test_archiving_is_not_a_deletion(self):
+        trip = self.create_trip('old')
+        Trip.objects.filter(id=trip.id).update(created_at=timezone.now() - datetime.timedelta(days=400))
+        token = self.changes()['sync_token']
+        call_command('archive_trips', stdout=io.StringIO())
+        self.assertEqual(self.changes(token)['deleted'], [])
+
+    def test_tombstones_do_not_depend_on_replica_reads(self):
+        archived = self.create_trip('archived')
+        deleted = self.create_trip('deleted')
+        Trip.objects.filter(id=archived.id).update(created_at=timezone.now() - datetime.timedelta(days=400))
+        token = self.changes()['sync_token']
+        deleted_id = deleted.id
+
+        def archive_and_delete():
+            call_command('archive_trips', stdout=io.StringIO())
+            with CaptureQueriesContext(connection) as queries:
+                deleted.delete()
+            self.assertFalse(any('tripwise_archivedtrip' in query['sql'] for query in queries))
+
+        self.assertNotIn(ArchivedTrip, unpinned_reads(archive_and_delete))
+        self.assertEqual(self.changes(token)['deleted'], [deleted_id])
+
+    def test_pages_never_pass_the_watermark(self):
+        old = self.create_trip('old')
+        Trip.objects.filter(id=old.id).update(updated_at=timezone.now() - datetime.timedelta(minutes=5))
+        self.create_trip('recent-1')
+        self.create_trip('recent-2')
+        with self.settings(TRIP_SYNC_SAFETY_SECONDS=60, TRIP_SYNC_PAGE_SIZE=1):
+            feed = self.changes()
+        # Recent writes wait for the next sync instead of moving the token past them
+        self.assertEqual([trip['notes'] for trip in feed['changed']], ['old'])
+        self.assertFalse(feed['has_more'])
+        since_time, _, _ = decode_token(feed['sync_token'])
+        self.assertLessEqual(since_time, timezone.now() - datetime.timedelta(seconds=59))
+        self.assertEqual([trip['notes'] for trip in self.changes(feed['sync_token'])['changed']],
+                         ['recent-1', 'recent-2'])
+
+    def test_full_sync_pages_through_archived_trips(self):
+        for notes in ('a1', 'a2', 'a3'):
+            trip = self.create_trip(notes)
+            Trip.objects.filter(id=trip.id).update(created_at=timezone.now() - datetime.timedelta(days=400))
+        self.create_trip('hot')
+        call_command('archive_trips', stdout=io.StringIO())
+        first = self.changes()
+        self.assertEqual([trip['notes'] for trip in first['changed']], ['a1', 'a2'])
+        self.assertTrue(first['has_more'])
+        second = self.changes(first['sync_token'])
+        self.assertEqual([trip['notes'] for trip in second['changed']], ['a3', 'hot'])
+        self.assertFalse(second['has_more'])
+
+    def test_invalid_token(self):
+        response = self.client.get('/api/trip/user/7/changes/?since=garbage')
+        self.assertEqual(response.status_code, 400)
+
+
+class AdminTests(TestCase):
+    def setUp(self):
+        admin = Driver.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        payload = make_trip_payload()
+        for _ in range(3):
+            Trip.objects.create(user_id=str(admin.id), daily_logs=payload['dailyLogs'],
+                                rest_stops=payload['restStops'], route_data=payload['routeData'],
+                                trip_details=payload['tripDetails'])
+
+    def test_summary_columns(self):
+        trip = Trip.objects.first()
+        self.assertEqual((trip.day_count, trip.total_miles, trip.stop_count), (1, 118.0, 1))
+
+    def test_summarize_trips_backfills_summaries(self):
+        Trip.objects.update(day_count=0, total_miles=0, stop_count=0)
+        call_command('summarize_trips', stdout=io.StringIO())
+        self.assertEqual(set(Trip.objects.values_list('day_count', 'total_miles', 'stop_count')), {(1, 118.0, 1)})
+
+    def test_trip_changelist_skips_json_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/tripwise/trip/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '118.0')
+        trip_queries = [query['sql'] for query in queries if 'FROM "tripwise_trip"' in query['sql']]
+        self.assertTrue(trip_queries)
+        for sql in trip_queries:
+            self.assertNotIn('daily_logs', sql)
+
+    def test_exact_search(self):
+        trip = Trip.objects.first()
+        response = self.client.get('/admin/tripwise/trip/', {'q': trip.id})
+        self.assertContains(response, f'/admin/tripwise/trip/{trip.id}/change/')
+        self.assertEqual(self.client.get('/admin/tripwise/driver/', {'q': 'admin'}).status_code, 200)
+        self.assertEqual(self.client.get(f'/admin/tripwise/trip/{trip.id}/change/').status_code, 200)
+
+
+class FixDriverTableTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.fingerprint = Path(directory.name) / 'fingerprint'
+
+    def run_command(self, *args):
+        out = io.StringIO()
+        with self.settings(SCHEMA_FINGERPRINT_PATH=self.fingerprint):
+            call_command('fix_driver_table', *args, stdout=out)
+        return out.getvalue()
+
+    def test_migrated_schema_is_up_to_date(self):
+        self.assertIn('up to date', self.run_command())
+        self.assertTrue(self.fingerprint.exists())
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIn('unchanged', self.run_command())
+        self.assertEqual(len(queries), 1)
+
+    def test_adds_missing_column_in_one_pass(self):
+        self.run_command()
+        with connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE tripwise_trip DROP COLUMN stop_count')
+        with self.assertRaises(CommandError):
+            self.run_command('--dry-run')
+        self.assertIn('completed', self.run_command())
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT stop_count FROM tripwise_trip')
+        self.assertIn('unchanged', self.run_command())
+
+
+@override_settings(REST_FRAMEWORK={
+    **settings.REST_FRAMEWORK,
+    'DEFAULT_THROTTLE_RATES': {'auth': '2/min', 'trip_read': '3/min'},
+})
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def login(self):
+        return self.client.post('/api/auth/login/', {'username': 'nobody', 'password': 'wrong'},
+                                content_type='application/json')
+
+    def test_exhausted_bucket_returns_429_with_retry_after(self):
+        now = time.time()
+        with mock.patch.object(TokenBucketThrottle, 'timer', lambda self: now):
+            self.assertNotEqual(self.login().status_code, 429)
+            self.assertNotEqual(self.login().status_code, 429)
+            response = self.login()
+        self.assertEqual(response.status_code, 429)
+        # 2 tokens per minute refill one token every 30 seconds
+        self.assertEqual(int(response['Retry-After']), 30)
+
+    def test_zero_rate_denies_every_request(self):
+        rates = {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], 'auth': '0/min'}
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates}):
+            response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(int(response['Retry-After']), 60)
+
+    def test_invalid_rates_are_rejected(self):
+        self.assertEqual(parse_rate('10/min'), (10, 10 / 60, 60))
+        for rate in ('-1/min', '10/week', '10', 'ten/min', '1.5/s'):
+            with self.subTest(rate=rate), self.assertRaises(ImproperlyConfigured):
+                parse_rate(rate)
+
+    def test_spoofed_forwarded_for_does_not_reset_the_bucket(self):
+        statuses = [
+            self.client.post('/api/auth/login/', {'username': 'nobody', 'password': 'wrong'},
+                             content_type='application/json',
+                             HTTP_X_FORWARDED_FOR=f'10.0.0.{attempt}, 203.0.113.7').status_code
+            for attempt in range(6)
+        ]
+        self.assertEqual(statuses[2:], [429] * 4)
+
+    def test_buckets_are_separate_per_scope(self):
+        for _ in range(2):
+            self.login()
+        self.assertEqual(self.login().status_code, 429)
+        self.assertEqual(self.client.get('/api/trip/user/7/').status_code, 200)
+
+    def test_buckets_are_separate_per_driver(self):
+        for _ in range(3):
+            self.client.get('/api/trip/user/7/')
+        self.assertEqual(self.client.get('/api/trip/user/7/').status_code, 429)
+        driver = Driver.objects.create_user(username='driver', email='driver@example.com', password='pw')
+        self.client.force_login(driver)
+        self.assertEqual(self.client.get('/api/trip/user/7/').status_code, 200)
+
+    def test_tokens_refill_over_time(self):
+        now = time.time()
+        with mock.patch.object(TokenBucketThrottle, 'timer', lambda self: now):
+            for _ in range(2):
+                self.login()
+            self.assertEqual(self.login().status_code, 429)
+        with mock.patch.object(TokenBucketThrottle, 'timer', lambda self: now + 31):
+            self.assertNotEqual(self.login().status_code, 429)
+            self.assertEqual(self.login().status_code, 429)
@@ -0,0 +1,92 @@
+"""
+Token-bucket rate limiting for the API views.
+
+Each view names a ``throttle_scope`` and every client (the logged-in driver, or
+the IP address for anonymous requests) gets one bucket per scope. A rate from
+``DEFAULT_THROTTLE_RATES`` such as ``'10/min'`` means a bucket of 10 tokens
+refilled at 10 tokens per minute, so clients may burst up to the capacity but
+not exceed the sustained rate. A count of 0 (``'0/min'``) turns the endpoint
+off: every request is denied and told to retry after one period.
+
+Bucket state is a ``(tokens, timestamp)`` pair in the default cache, so it is
+shared between workers when a file-based or other shared cache is configured.
+The read-modify-write is not atomic; under a race a client can occasionally
+get one extra request through, which is an acceptable trade for needing only
+one cache read and one write per request.
+"""
+import re
+import time
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+RATE = re.compile(r'\s*(\d+)\s*/\s*([smhd])[a-z]*\s*')
+
+
+def parse_rate(rate):
+    """
+    Return ``(capacity, tokens per second, period seconds)`` for a DRF rate
+    like '10/min'. Raises ImproperlyConfigured for anything else, so a typo in
+    a ``THROTTLE_RATE_*`` variable fails loudly instead of on every request.
+    """
+    match = RATE.fullmatch(rate)
+    if match is None:
+        raise ImproperlyConfigured(
+            f"Invalid throttle rate {rate!r}; expected '<count>/<s|min|hour|day>'")
+    capacity = int(match.group(1))
+    period = PERIODS[match.group(2)]
+    return capacity, capacity / period, period
+
+
+class TokenBucketThrottle(BaseThrottle):
+    cache = cache
+    timer = time.time
+    cache_format = 'throttle_bucket_%(scope)s_%(ident)s'
+
+    _parsed_rates = {}
+
+    def get_rate(self, scope):
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if rate is None:
+            return None
+        if rate not in self._parsed_rates:
+            self._parsed_rates[rate] = parse_rate(rate)
+        return self._parsed_rates[rate]
+
+    def get_cache_key(self, request, view):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            ident = f'user_{user.pk}'
+        else:
+            ident = f'ip_{self.get_ident(request)}'
+        return self.cache_format % {'scope': view.throttle_scope, 'ident': ident}
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        scope = getattr(view, 'throttle_scope', None)
+        rate = self.get_rate(scope) if scope else None
+        if rate is None:
+            return True
+        capacity, refill_per_second, period = rate
+        if capacity == 0:
+            self.wait_seconds = period
+            return False
+
+        key = self.get_cache_key(request, view)
+        now = self.timer()
+        tokens, updated = self.cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+
+        if tokens < 1:
+            self.wait_seconds = (1 - tokens) / refill_per_second
+            return False
+
+        # Keep the bucket around long enough to refill completely
+        self.cache.set(key, (tokens - 1, now), int(capacity / refill_per_second) + 1)
+        return True
+
+    def wait(self):
+        return self.wait_seconds
@@ -0,0 +1,262 @@
+"""
+Schema validation for saved trips.
+
+The SavedTrip shape from the frontend is described once with a few small
+combinators and compiled into nested closures at import time, so validating a
+request is a single pass over the payload with no schema interpretation.
+Errors are collected as ``{'path': ..., 'message': ...}`` dicts.
+"""
+import json
+import re
+
+import numpy as np
+from django.utils.dateparse import parse_datetime
+
+MAX_ERRORS = 20
+
+# Bytes that matter for nesting depth; everything else is dropped before scanning
+_STRUCTURAL = b'"[]{}'
+_NON_STRUCTURAL = bytes(byte for byte in range(256) if byte not in _STRUCTURAL)
+_DEPTH_STEP = np.zeros(256, dtype=np.int32)
+_DEPTH_STEP[list(b'[{')] = 1
+_DEPTH_STEP[list(b']}')] = -1
+_QUOTE = ord('"')
+
+class _TooManyErrors(Exception):
+    pass
+
+
+def _fail(errors, path, message):
+    errors.append({'path': path or '$', 'message': message})
+    if len(errors) >= MAX_ERRORS:
+        raise _TooManyErrors
+
+
+def string(max_length=1000, pattern=None, choices=None, check=None):
+    regex = re.compile(pattern) if pattern else None
+    choices = frozenset(choices) if choices else None
+
+    def validate(value, path, errors):
+        if not isinstance(value, str):
+            return _fail(errors, path, 'Expected a string')
+        if len(value) > max_length:
+            return _fail(errors, path, f'Longer than {max_length} characters')
+        if choices is not None and value not in choices:
+            return _fail(errors, path, f"Must be one of: {', '.join(sorted(choices))}")
+        if regex is not None and not regex.fullmatch(value):
+            return _fail(errors, path, 'Invalid format')
+        if check is not None:
+            try:
+                valid = check(value)
+            except ValueError:
+                # e.g. parse_datetime on a well-formed but impossible date
+                valid = False
+            if not valid:
+                return _fail(errors, path, 'Invalid value')
+    return validate
+
+
+def number(minimum=None):
+    def validate(value, path, errors):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return _fail(errors, path, 'Expected a number')
+        if minimum is not None and value < minimum:
+            return _fail(errors, path, f'Must be at least {minimum}')
+    return validate
+
+
+def boolean():
+    def validate(value, path, errors):
+        if not isinstance(value, bool):
+            _fail(errors, path, 'Expected a boolean')
+    return validate
+
+
+def one_of(*validators):
+    """Accept the value if any validator accepts it."""
+    def validate(value, path, errors):
+        for validator in validators:
+            attempt = []
+            try:
+                validator(value, path, attempt)
+            except _TooManyErrors:
+                pass
+            if not attempt:
+                return
+        _fail(errors, path, 'Unexpected type')
+    return validate
+
+
+def nullable(validator):
+    def validate(value, path, errors):
+        if value is not None:
+            validator(value, path, errors)
+    return validate
+
+
+def array(item, max_items=1000):
+    def validate(value, path, errors):
+        if not isinstance(value, list):
+            return _fail(errors, path, 'Expected a list')
+        if len(value) > max_items:
+            return _fail(errors, path, f'More than {max_items} items')
+        for index, element in enumerate(value):
+            item(element, f'{path}[{index}]', errors)
+    return validate
+
+
+def obj(required=None, optional=None):
+    """Validate an object; keys not named in the schema are allowed."""
+    fields = [(name, validator, True) for name, validator in (required or {}).items()]
+    fields += [(name, validator, False) for name, validator in (optional or {}).items()]
+
+    def validate(value, path, errors):
+        if not isinstance(value, dict):
+            return _fail(errors, path, 'Expected an object')
+        prefix = f'{path}.' if path else ''
+        for name, validator, is_required in fields:
+            if name in value:
+                validator(value[name], prefix + name, errors)
+            elif is_required:
+                _fail(errors, prefix + name, 'This field is required')
+    return validate
+
+
+# Log entries are "HH:MM" (up to "24:00"), the only form the HOS audit and the
+# log bitmap can read; rest stop times stay free-form since Gemini routes write
+# "hh:mm AM" and OSRM routes write ISO timestamps
+LOG_TIME = r'(?:[01]\d|2[0-3]):[0-5]\d|24:00'
+ISO_DATE = r'\d{4}-\d{2}-\d{2}'
+
+_location = string(500)
+
+_route_segment = obj(
+    required={
+        'startLocation': _location,
+        'endLocation': _location,
+        'distance': number(minimum=0),
+        'estimatedDrivingTime': number(minimum=0),
+    },
+)
+
+_rest_stop = obj(
+    required={
+        'location': _location,
+        'type': string(choices=('rest', 'fuel', 'food', 'pickup', 'dropoff')),
+        'arrivalTime': string(100),
+        'departureTime': string(100),
+    },
+    optional={
+        'duration': string(100),
+        'stopReason': string(),
+    },
+)
+
+_log_entry = obj(
+    required={
+        'startTime': string(5, pattern=LOG_TIME),
+        'endTime': string(5, pattern=LOG_TIME),
+        'status': string(choices=('driving', 'on-duty', 'off-duty', 'sleeper')),
+        'location': _location,
+    },
+    optional={
+        'remarks': nullable(string()),
+    },
+)
+
+_daily_log = obj(
+    required={
+        'date': string(10, pattern=ISO_DATE),
+        'logs': array(_log_entry, max_items=200),
+        'totalMiles': number(minimum=0),
+    },
+    optional={
+        'startLocation': _location,
+        'endLocation': _location,
+    },
+)
+
+_trip_details = obj(
+    required={
+        'currentLocation': _location,
+        'pickupLocation': _location,
+        'dropoffLocation': _location,
+    },
+    optional={
+        'currentCycle': string(50),
+        'availableDrivingHours': one_of(string(50), number(minimum=0)),
+    },
+)
+
+_route_data = obj(
+    required={
+        'segments': array(_route_segment, max_items=200),
+        'totalDistance': number(minimum=0),
+        'totalDrivingTime': number(minimum=0),
+    },
+    optional={
+        'restStops': array(_rest_stop, max_items=500),
+        'hosCompliant': boolean(),
+        'violations': array(string(), max_items=200),
+        'multiDayTrip': boolean(),
+        'dailyMiles': array(number(minimum=0), max_items=60),
+    },
+)
+
+_saved_trip = obj(
+    required={
+        'userId': one_of(string(255), number()),
+        'createdAt': string(64, check=lambda value: parse_datetime(value) is not None),
+        'tripDetails': _trip_details,
+        'routeData': _route_data,
+        'restStops': array(_rest_stop, max_items=500),
+        'dailyLogs': array(_daily_log, max_items=60),
+    },
+    optional={
+        'id': string(255),
+        'notes': nullable(string(10000)),
+    },
+)
+
+
+def validate_saved_trip(data):
+    """Validate a SavedTrip payload and return a list of errors (empty if valid)."""
+    errors = []
+    try:
+        _saved_trip(data, '', errors)
+    except _TooManyErrors:
+        pass
+    return errors
+
+
+def json_depth(body):
+    """Maximum object/array nesting depth of a JSON document, without parsing it.
+
+    Escaped backslashes and quotes are removed and every byte other than
+    quotes and brackets is dropped, all with C-level bytes operations. The
+    remaining tokens are scanned with NumPy, ignoring brackets between quotes.
+    """
+    if b'\\' in body:
+        body = body.replace(b'\\\\', b'').replace(b'\\"', b'')
+    tokens = body.translate(None, _NON_STRUCTURAL)
+    if not tokens:
+        return 0
+    codes = np.frombuffer(tokens, dtype=np.uint8)
+    steps = _DEPTH_STEP[codes]
+    steps[(np.cumsum(codes == _QUOTE) & 1).astype(bool)] = 0
+    return int(np.cumsum(steps).max())
+
+
+def loads_limited(body, max_depth):
+    """Parse a JSON request body after rejecting documents nested too deeply."""
+    if json_depth(body) > max_depth:
+        raise ValueError(f'JSON nesting deeper than {max_depth} levels')
+    try:
+        return json.loads(body, parse_constant=_reject_constant)
+    except RecursionError:
+        # Only reachable if the scan was fooled by malformed input
+        raise ValueError(f'JSON nesting deeper than {max_depth} levels')
+
+
+def _reject_constant(value):
+    raise ValueError(f'Invalid JSON constant {value}')
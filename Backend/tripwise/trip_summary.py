@@ -0,0 +1,21 @@
+def _number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return value
+
+
+def summarize_trip(daily_logs, rest_stops, route_data):
+    """Return ``(day_count, total_miles, stop_count)`` for a trip's JSON columns.
+
+    Miles come from the route's totalDistance, falling back to the sum of the
+    daily logs' totalMiles.
+    """
+    daily_logs = daily_logs if isinstance(daily_logs, list) else []
+    rest_stops = rest_stops if isinstance(rest_stops, list) else []
+
+    total_miles = _number(route_data.get('totalDistance')) if isinstance(route_data, dict) else None
+    if total_miles is None:
+        total_miles = sum(
+            _number(log.get('totalMiles')) or 0 for log in daily_logs if isinstance(log, dict)
+        )
+    return len(daily_logs), float(total_miles), len(rest_stops)
@@ -1,12 +1,17 @@
 from django.urls import path
 from . import views
-from .views import TripSavingView, UserTripsView, api_status, ping
+from .views import TripSavingView, TripDetailView, UserTripsView, UserTripChangesView, UserTripAuditView, FleetAuditView, MultiStopPlanView, api_status, ping
 
 urlpatterns = [
     path('', api_status, name='api_root_status'),  # API root URL to show API status
     path('ping/', ping, name='ping'),  # Simple ping endpoint to keep the backend awake
     path('auth/register/', views.DriverRegistrationView.as_view(), name='driver-register'),
     path('auth/login/', views.DriverLoginView.as_view(), name='driver-login'),
+    path('trip/plan/', MultiStopPlanView.as_view(), name='plan_trip'),
     path('trip/save/', TripSavingView.as_view(), name='save_trip'),
+    path('trip/<int:trip_id>/', TripDetailView.as_view(), name='trip_detail'),
     path('trip/user/<int:user_id>/', UserTripsView.as_view(), name='user_trips'),
+    path('trip/user/<int:user_id>/changes/', UserTripChangesView.as_view(), name='user_trip_changes'),
+    path('trip/user/<int:user_id>/audit/', UserTripAuditView.as_view(), name='user_trip_audit'),
+    path('audit/', FleetAuditView.as_view(), name='fleet_audit'),
 ]
\ No newline at end of file
@@ -4,11 +4,24 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.decorators import api_view, permission_classes
 from django.contrib.auth import authenticate, login
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from .serializers import DriverRegistrationSerializer, DriverLoginSerializer
 from django.contrib.auth import get_user_model
-from .models import Trip  # Import the Trip model
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import Trip, ArchivedTrip, IdempotencyKey, TripTombstone, audit_rows  # Import the models
+from .hos_audit import audit_days, audit_fleet, load_histories
+from .planner import PlanningError, plan_trip
+from .parsers import TripJSONParser
+from .trip_schema import validate_saved_trip
+from .throttling import TokenBucketThrottle
+from .sync import InvalidSyncToken, decode_token, encode_token, safe_watermark
+from django.db.models import Q
 import datetime
+import hashlib
+import json
+import os
 
 User = get_user_model()
 
@@ -35,6 +48,8 @@ def ping(request):
 class DriverRegistrationView(generics.CreateAPIView):
     serializer_class = DriverRegistrationSerializer
     permission_classes = [AllowAny]  # Allow anyone to register
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'auth'
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -52,6 +67,8 @@ class DriverRegistrationView(generics.CreateAPIView):
 class DriverLoginView(APIView):
     serializer_class = DriverLoginSerializer
     permission_classes = [AllowAny]  # Allow login for all users
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'auth'
 
     def post(self, request):
         serializer = self.serializer_class(data=request.data)
@@ -78,10 +95,54 @@ class DriverLoginView(APIView):
 # Trip Saving View
 class TripSavingView(APIView):
     permission_classes = [AllowAny]  # Allow anyone to save trips
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'trip_write'
+    parser_classes = [TripJSONParser]  # Size and nesting limits before parsing
 
     def post(self, request):
         data = request.data
-        # Assuming data structure is validated, you can add validation logic here
+        errors = validate_saved_trip(data)
+        if errors:
+            return Response({'error': 'Invalid trip data', 'details': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Retries of the same save carry the client-generated trip id
+        key = request.headers.get('Idempotency-Key')
+        if key is not None:
+            key = key.strip()
+            if not key or len(key) > IdempotencyKey._meta.get_field('key').max_length:
+                return Response({'error': 'Invalid Idempotency-Key header'}, status=status.HTTP_400_BAD_REQUEST)
+        key = key or data.get('id')
+        if not key:
+            return self._save(data)[1]
+
+        user_id = str(data['userId'])
+        request_hash = hashlib.sha256(
+            json.dumps(data, sort_keys=True, separators=(',', ':')).encode()
+        ).hexdigest()
+        cutoff = timezone.now() - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        replay = self._replay(user_id, key, request_hash, cutoff)
+        if replay is not None:
+            return replay
+
+        try:
+            with transaction.atomic():
+                trip, response = self._save(data)
+                IdempotencyKey.objects.create(
+                    user_id=user_id,
+                    key=key,
+                    request_hash=request_hash,
+                    status_code=response.status_code,
+                    response=response.data,
+                )
+        except IntegrityError:
+            # A concurrent request with the same key won; its trip is the one kept
+            replay = self._replay(user_id, key, request_hash, cutoff)
+            if replay is None:
+                return Response({'error': 'Trip save already in progress'}, status=status.HTTP_409_CONFLICT)
+            return replay
+        return response
+
+    def _save(self, data):
         trip = Trip.objects.create(
             user_id=data['userId'],
             created_at=data['createdAt'],
@@ -91,24 +152,184 @@ class TripSavingView(APIView):
             route_data=data['routeData'],
             trip_details=data['tripDetails']
         )
-        return Response({'message': 'Trip saved successfully', 'tripId': trip.id}, status=status.HTTP_201_CREATED)
+        return trip, Response({'message': 'Trip saved successfully', 'tripId': trip.id}, status=status.HTTP_201_CREATED)
+
+    def _replay(self, user_id, key, request_hash, cutoff):
+        record = IdempotencyKey.objects.filter(user_id=user_id, key=key).first()
+        if record is None:
+            return None
+        if record.created_at < cutoff:
+            # Expired but not yet purged; free the key for this request
+            record.delete()
+            return None
+        if record.request_hash and record.request_hash != request_hash:
+            return Response({'error': 'Idempotency-Key was already used with a different request body'},
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        return Response(record.response, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+
+def trip_to_dict(trip):
+    return {
+        'id': trip.id,
+        'created_at': trip.created_at,
+        'daily_logs': trip.daily_logs,
+        'notes': trip.notes,
+        'rest_stops': trip.rest_stops,
+        'route_data': trip.route_data,
+        'trip_details': trip.trip_details,
+    }
 
 # User Trips View
 class UserTripsView(APIView):
     permission_classes = [AllowAny]  # Allow anyone to view trips
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'trip_read'
 
     def get(self, request, user_id):
-        trips = Trip.objects.filter(user_id=user_id)
-        trip_data = [
-            {
-                'id': trip.id,
-                'created_at': trip.created_at,
-                'daily_logs': trip.daily_logs,
-                'notes': trip.notes,
-                'rest_stops': trip.rest_stops,
-                'route_data': trip.route_data,
-                'trip_details': trip.trip_details,
-            }
-            for trip in trips
-        ]
+        trips = list(Trip.objects.filter(user_id=user_id).defer('log_bitmap', 'log_side_table'))
+        # Old trips live compressed in the archive table
+        trips += [archived.to_trip() for archived in ArchivedTrip.objects.filter(user_id=user_id)]
+        trips.sort(key=lambda trip: (trip.created_at, trip.id))
+        trip_data = [trip_to_dict(trip) for trip in trips]
         return Response(trip_data, status=status.HTTP_200_OK)
+
+# Trip Detail View
+class TripDetailView(APIView):
+    permission_classes = [AllowAny]  # Same access as the trip history
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'trip_read'
+
+    def get(self, request, trip_id):
+        trip = Trip.objects.filter(id=trip_id).defer('log_bitmap', 'log_side_table').first()
+        if trip is None:
+            archived = ArchivedTrip.objects.filter(id=trip_id).first()
+            if archived is None:
+                return Response({'error': 'Trip not found'}, status=status.HTTP_404_NOT_FOUND)
+            trip = archived.to_trip()
+        return Response(trip_to_dict(trip), status=status.HTTP_200_OK)
+
+# User Trip Changes View
+class UserTripChangesView(APIView):
+    permission_classes = [AllowAny]  # Same access as the trip history
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'trip_read'
+
+    def get(self, request, user_id):
+        now = timezone.now()
+        # Rows past the watermark may still have earlier-stamped writes committing
+        # behind them, and replicas may be up to REPLICA_MAX_LAG_SECONDS behind
+        margin = settings.TRIP_SYNC_SAFETY_SECONDS
+        if settings.DATABASE_REPLICAS:
+            margin += settings.REPLICA_MAX_LAG_SECONDS
+        watermark = safe_watermark(now, margin)
+
+        since_time, since_id, archived_after = None, 0, 0
+        since = request.query_params.get('since')
+        if since:
+            try:
+                since_time, since_id, archived_after = decode_token(since)
+            except InvalidSyncToken as error:
+                return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+            if since_time is not None and since_time < now - datetime.timedelta(
+                    days=settings.TRIP_TOMBSTONE_RETENTION_DAYS):
+                return Response({'error': 'Sync token expired, fetch the full trip list again'},
+                                status=status.HTTP_410_GONE)
+
+        page_size = settings.TRIP_SYNC_PAGE_SIZE
+        changed = []
+        # A full sync starts with the archived trips; they never change afterwards
+        if archived_after is not None:
+            archived = list(
+                ArchivedTrip.objects.filter(user_id=user_id, id__gt=archived_after).order_by('id')[:page_size + 1]
+            )
+            if len(archived) > page_size:
+                archived = archived[:page_size]
+                return self._page([trip.to_trip() for trip in archived], [],
+                                  encode_token(None, 0, archived[-1].id), True)
+            changed = [trip.to_trip() for trip in archived]
+
+        remaining = page_size - len(changed)
+        if not remaining:
+            return self._page(changed, [], encode_token(since_time, since_id), True)
+
+        trips = Trip.objects.filter(user_id=user_id, updated_at__lte=watermark).defer('log_bitmap', 'log_side_table')
+        tombstones = TripTombstone.objects.filter(user_id=user_id, deleted_at__lte=watermark)
+        if since_time is not None:
+            trips = trips.filter(Q(updated_at__gt=since_time) | Q(updated_at=since_time, id__gt=since_id))
+            tombstones = tombstones.filter(deleted_at__gt=since_time)
+        else:
+            tombstones = tombstones.none()
+
+        hot = list(trips.order_by('updated_at', 'id')[:remaining + 1])
+        has_more = len(hot) > remaining
+        if has_more:
+            hot = hot[:remaining]
+            last = hot[-1]
+            token = encode_token(last.updated_at, last.id)
+            tombstones = tombstones.filter(deleted_at__lte=last.updated_at)
+        else:
+            token = encode_token(watermark)
+        return self._page(changed + hot, tombstones.values_list('trip_id', flat=True), token, has_more)
+
+    def _page(self, trips, deleted_ids, token, has_more):
+        changed_data = []
+        for trip in trips:
+            trip_data = trip_to_dict(trip)
+            trip_data['updated_at'] = trip.updated_at or trip.created_at
+            changed_data.append(trip_data)
+        return Response({
+            'changed': changed_data,
+            'deleted': sorted(set(deleted_ids)),
+            'sync_token': token,
+            'has_more': has_more,
+        }, status=status.HTTP_200_OK)
+
+# User Trip Audit View
+class UserTripAuditView(APIView):
+    permission_classes = [AllowAny]  # Same access as the trip history
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'trip_compute'
+
+    def get(self, request, user_id):
+        histories = load_histories(audit_rows(user_id))
+        report = audit_fleet(histories, workers=1).get(str(user_id))
+        if report is None:
+            report = audit_days([])
+        return Response(report, status=status.HTTP_200_OK)
+
+# Fleet Audit View
+class FleetAuditView(APIView):
+    permission_classes = [IsAdminUser]  # Audits every driver's history
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'trip_compute'
+
+    def get(self, request):
+        try:
+            workers = int(request.query_params['workers']) if 'workers' in request.query_params else None
+        except ValueError:
+            return Response({'error': 'workers must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if workers is not None:
+            if workers < 1:
+                return Response({'error': 'workers must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+            # Never fork more processes than there are CPUs from a web worker
+            workers = min(workers, os.cpu_count() or 1)
+        histories = load_histories(audit_rows())
+        reports = audit_fleet(histories, workers=workers)
+        return Response({
+            'drivers': len(reports),
+            'driver_days': sum(report['days'] for report in reports.values()),
+            'non_compliant': sorted(user_id for user_id, report in reports.items() if not report['compliant']),
+            'reports': reports,
+        }, status=status.HTTP_200_OK)
+
+# Multi-Stop Planning View
+class MultiStopPlanView(APIView):
+    permission_classes = [AllowAny]  # Planning does not touch stored data
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'trip_compute'
+
+    def post(self, request):
+        try:
+            plan = plan_trip(request.data)
+        except PlanningError as error:
+            return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(plan, status=status.HTTP_200_OK)
@@ -58,6 +58,7 @@ export const tripHistoryService = {
           headers: {
             'Content-Type': 'application/json',
             'X-Requested-With': 'XMLHttpRequest',
+            'Idempotency-Key': id, // Lets the backend replay retried saves
           },
           credentials: 'include', // Include cookies for CSRF token
           body: JSON.stringify(newTrip),